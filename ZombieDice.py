@@ -5,32 +5,9 @@
 #=  Zombie Dice Game      =
 #==========================
 
-import os, sys, random, time, copy, collections
-from functools import update_wrapper
-
-def decorator(d):
-    "Make function d a decorator: d wraps a function fn."
-    def _d(fn):
-        return update_wrapper(d(fn), fn)
-    update_wrapper(_d, d)
-    return _d
-
-@decorator
-def memo(f):
-    """Decorator that caches the return value for each call to f(args).
-    Then when called again with same args, we can just look it up."""
-    cache = {}
-    def _f(*args):
-        try:
-            return cache[args]
-        except KeyError:
-            cache[args] = result = f(*args)
-            return result
-        except TypeError:
-            # some element of args refuses to be a dict key
-            return f(args)
-    _f.cache = cache
-    return _f
+import os, sys, random, time, collections
+import memocache, dicerng, registry
+from memocache import memo
 
 @memo
 def colored(s, color=''):
@@ -47,6 +24,18 @@ def colored(s, color=''):
     else:
         return s
 
+# faces of each color of dice, and the full bag at the start of each turn
+DICETYPE = {'Green'  : (['brain']*3 + ['shotgun']*1 + ['runner']*2),
+            'Yellow' : (['brain']*2 + ['shotgun']*2 + ['runner']*2),
+            'Red'    : (['brain']*1 + ['shotgun']*3 + ['runner']*2)}
+FULL_BAG = ['Green'] * 6 + ["Yellow"] * 4 + ["Red"] * 3
+
+SimplePlayer = collections.namedtuple('simple_player', 'name, score')
+Dice = collections.namedtuple('dice', 'color, face')
+# pickle finds a namedtuple by its type name
+simple_player = SimplePlayer
+dice = Dice
+
 class Zombiedice(object):
     """ Zombie Dice Game Rules: (From Wikipedia)
     The player has to shake a cup containing 13 dice and randomly select 3 of them without looking into the cup and
@@ -61,15 +50,15 @@ class Zombiedice(object):
     have taken at least one more turn without reaching 13 brains.
     """
 
-    def __init__(self, goal=13, players=None, fastmode=False):
+    def __init__(self, goal=13, players=None, fastmode=False, preload=False, rng=None):
         print("*********************************")
         print("*          Zombie Dice          *")
         print("*********************************")
         print(self.__doc__)
+        # the random generator of the bag and the rolls, see dicerng.py, the random module by default
+        self.rng = rng if rng is not None else random
         self.reset()
-        self.dicetype = {'Green'  : (['brain']*3 + ['shotgun']*1 + ['runner']*2),
-                         'Yellow' : (['brain']*2 + ['shotgun']*2 + ['runner']*2),
-                         'Red'    : (['brain']*1 + ['shotgun']*3 + ['runner']*2)}
+        self.dicetype = DICETYPE
         self.emoji = {'brain'  : '🎃',
                       'shotgun': '🔫',
                       'runner' : '👟'}
@@ -77,9 +66,14 @@ class Zombiedice(object):
         self.players = []
         self.fastmode = fastmode
         self.playing = None
+        self.playing_idx = None
         self.add_players(players)
-        self.simple_player = collections.namedtuple('simple_player', 'name, score')
-        self.dice = collections.namedtuple('dice', 'color, face')
+        if preload:
+            self.preload_players()
+        self.simple_player = SimplePlayer
+        self.dice = Dice
+        # the instruments called around the game loop, see instrument.py
+        self.instruments = []
 
     def add_players(self, players=None):
         if players is None or len(players) == 0:
@@ -87,6 +81,15 @@ class Zombiedice(object):
             players = names.split()
         for p in players:
             self.players.append(Player(p))
+        self.players_view = None
+
+    def preload_players(self):
+        """ Let the strategies load their data in the background while the game starts """
+        for p in self.players:
+            try:
+                p.preload(len(self.players), self.goal)
+            except AttributeError:
+                pass
 
     def reset(self):
         self.reset_table()
@@ -97,21 +100,22 @@ class Zombiedice(object):
         self.table = Table()
 
     def reset_bag(self):
-        self.bag = ['Green'] * 6 + ["Yellow"] * 4 + ["Red"] * 3
-        random.shuffle(self.bag)
+        self.bag = Bag(rng=self.rng)
 
     def reset_player_score(self):
         if hasattr(self, 'players'):
             for p in self.players:
                 p.score = 0
+        # the players given to the strategies are built again when a score changes
+        self.players_view = None
 
     @property
     def state(self):
-        bag = copy.copy(self.bag)
-        table = Table(copy.copy(self.table.dices))
-        players = [self.simple_player(p.name, p.score) for p in self.players]
-        playing = players[self.players.index(self.playing)]
-        return {'bag':bag, 'table':table, 'players':players, 'playing':playing, 'goal':self.goal}
+        players = self.players_view
+        if players is None:
+            players = self.players_view = tuple(self.simple_player(p.name, p.score) for p in self.players)
+        idx = self.playing_idx if self.playing_idx is not None else self.players.index(self.playing)
+        return GameState(self.bag.view(), self.table.snapshot(), players, players[idx], self.goal)
 
     def play(self):
         if self.fastmode < 2:
@@ -119,6 +123,8 @@ class Zombiedice(object):
             print("**  Game Start  **")
             print("******************")
         i_round = 0
+        if self.instruments:
+            start = time.perf_counter()
         while True:
             i_round += 1
             if self.fastmode < 2:
@@ -126,24 +132,29 @@ class Zombiedice(object):
                 print("**       ROUND %2d       **"%i_round)
                 print("**************************")
                 self.delay(1)
-            for p in self.players:
+            for idx, p in enumerate(self.players):
                 if self.fastmode < 2:
                     print("\n========== %s's Turn ==========\n"%p.name)
                     self.delay(1)
                     self.print_scores()
-                self.playing = p
+                self.playing, self.playing_idx = p, idx
                 while True:
                     move = self.get_strategy(p)
                     if move == 'hold':
                         if self.fastmode < 2:
                             print("😊  %s collected %d brains"%(p.name, self.table.n_brains))
+                        if self.instruments:
+                            self.emit('turn', p.name, self.table.n_brains, False)
                         p.score += self.table.n_brains
+                        self.players_view = None
                         break
                     elif move == 'roll':
                         if self.fastmode < 2:
                             print("🎲  %s is rolling the dice ! 🎲"%p.name)
                         dices = self.roll()
                         self.table.add(dices)
+                        if self.instruments:
+                            self.emit('roll', p.name, dices)
                         if self.fastmode < 2:
                             self.delay(1)
                             self.show_table()
@@ -151,6 +162,8 @@ class Zombiedice(object):
                         if self.table.n_shotguns > 2:
                             if self.fastmode < 2:
                                 print("😢  %s got %d shotguns and lost the brains"%(p.name, self.table.n_shotguns))
+                            if self.instruments:
+                                self.emit('turn', p.name, 0, True)
                             break
                         self.check_bag_empty()
                     else:
@@ -174,6 +187,8 @@ class Zombiedice(object):
                         sys.stdout.flush()
                         self.delay(0.1)
                 winners = [ p.name for p in self.players if p.score == max_score ]
+                if self.instruments:
+                    self.emit('game', winners, i_round, time.perf_counter() - start)
                 if self.fastmode < 2:
                     self.delay(1.5)
                     winnerbar = ' and '.join(winners)
@@ -186,17 +201,15 @@ class Zombiedice(object):
 
     def roll(self):
         n_draw = 3 - self.table.n_runners
-        # get the colors for the existing runner dice
-        runner_colors = [dice[0] for dice in self.table.dices if dice[1] == 'runner']
-        # pick up the runner dices (remove from table)
-        self.table.dices = [d for d in self.table.dices if d[1]!='runner']
+        # pick up the runner dices (remove from table) and get their colors
+        runner_colors = self.table.pick_up_runners()
         # draw dices from bag so we have 3 in hand
-        dice_colors = runner_colors + self.bag[:n_draw]
-        self.bag = self.bag[n_draw:]
+        dice_colors = runner_colors + self.bag.draw(n_draw)
         # print a rolling picture
         self.dice_rolling(dice_colors)
         # roll each dice to get the face
-        dice_faces = [random.choice(self.dicetype[d]) for d in dice_colors]
+        choice = self.rng.choice
+        dice_faces = [choice(self.dicetype[d]) for d in dice_colors]
         # zip the color and face to form a list of dices
         result = [self.dice(color,face) for color,face in zip(dice_colors, dice_faces)]
         if self.fastmode < 2:
@@ -204,14 +217,12 @@ class Zombiedice(object):
         return result
 
     def check_bag_empty(self):
-        runners = [d for d in self.table.dices if d.face == 'runner']
+        runners = self.table.runners
         if len(self.bag) < 3 - len(runners):
             if self.fastmode < 2:
                 print("Bag is empty! Putting all dices back and keep the scores.")
-            self.reset_bag()
             # remove existing runners from new bag
-            for d in runners:
-                self.bag.remove(d.color)
+            self.bag.refill([d.color for d in runners])
 
     def dices_pic(self, dices):
         """ Draw the pic for dices """
@@ -222,6 +233,7 @@ class Zombiedice(object):
     def dice_rolling(self, dice_colors):
         if not self.fastmode:
             for _ in range(5):
+                # only for the show, it does not use the random generator of the game
                 print(' '+'     '.join([ colored("%s"%(random.choice(["⬛︎","⬜︎","▣","◈"])),c) for c in dice_colors ]), end='\r')
                 self.delay(0.5)
 
@@ -241,8 +253,7 @@ class Zombiedice(object):
         title_len = max((nd * 6 - 1), 20)
         title_bar = ''.join(['-']*(title_len // 2 - 4)) + '- Table -' + ''.join(['-']*(title_len // 2 - 4))
         print(title_bar)
-        self.table.dices.sort(key=lambda x: x[1])
-        self.dices_pic(self.table.dices)
+        self.dices_pic(sorted(self.table.dices, key=lambda x: x[1]))
         print(''.join(['-']*(len(title_bar))) + '\n')
 
     def delay(self, n):
@@ -251,7 +262,23 @@ class Zombiedice(object):
             time.sleep(n)
 
     def get_strategy(self, p):
-        return p.strategy(self.state)
+        if not self.instruments:
+            return p.strategy(self.state)
+        start = time.perf_counter()
+        state = self.state
+        built = time.perf_counter()
+        move = p.strategy(state)
+        self.emit('decision', p.name, move, time.perf_counter() - built, built - start)
+        return move
+
+    def emit(self, event, *args):
+        for instrument in self.instruments:
+            getattr(instrument, event)(*args)
+
+def find_strategy(name):
+    """ The strategy module of a player name from the registry, imported once and shared by all the players
+    and games, or None if it is not found. See registry.py for where the strategies are searched """
+    return registry.find(name)
 
 class Player(object):
     @property
@@ -283,23 +310,22 @@ class Player(object):
         self.name = name
         self.score = score
         print("Setting up player %s"%name)
-        # Allow name to be appended by a number
-        if (not name[0].isdigit()) and (name[-1].isdigit()):
-            name = name[:-1]
         # search for the strategy file
-        for f in os.listdir('.'):
-            filename, fileext = os.path.splitext(f)
-            if name.lower() == filename.lower() and fileext == '.py':
-                print('-- strategy found in %s'%f)
-                p = __import__(filename)
-                try:
-                    self.strategy = p.strategy
-                except:
-                    raise RuntimeError("Function strategy(state) is not found in %s"%filename)
-                try:
-                    self.finish = p.finish
-                except:
-                    pass
+        p = find_strategy(name)
+        if p is not None:
+            print('-- strategy found in %s'%(getattr(p, '__file__', None) or p.__name__))
+            try:
+                self.strategy = p.strategy
+            except:
+                raise RuntimeError("Function strategy(state) is not found in %s"%p.__name__)
+            try:
+                self.finish = p.finish
+            except:
+                pass
+            try:
+                self.preload = p.preload
+            except:
+                pass
         # if not found, use manual input
         if not hasattr(self, 'strategy'):
             print('-- strategy file is not found, set as manual input.')
@@ -316,26 +342,202 @@ class Player(object):
         # After 3 failiers
         return 'hold'
 
-class Table(object):
-    @property
-    def n_brains(self):
-        return len([d for d in self.dices if d[1] == 'brain'])
+# the colors and faces of the dices in the order of the counts of a Table, the same as in optimal.py
+COLORS = ('Green', 'Yellow', 'Red')
+FACES = ('brain', 'runner', 'shotgun')
+COLOR_INDEX = {c: i for i, c in enumerate(COLORS)}
+FACE_INDEX = {f: i for i, f in enumerate(FACES)}
 
-    @property
-    def n_shotguns(self):
-        return len([d for d in self.dices if d[1] == 'shotgun'])
+class Table(object):
+    """ The dices on the table of the playing player.
 
-    @property
-    def n_runners(self):
-        return len([d for d in self.dices if d[1] == 'runner'])
+    The brains and shotguns stay on the table until the end of the turn, the runners only until the next roll.
+    counts[color][face] is the number of dices of each color with each face, counted as the dices are added,
+    the same as the dices of optimal.py: ((green brains, runners, shotguns), (yellow ...), (red ...)).
+    """
 
     def __init__(self, dices=None):
-        self.dices = []
+        self.clear()
         if dices is not None:
             self.add(dices)
 
+    def clear(self):
+        self.kept = []
+        self.runners = []
+        self.n_brains = 0
+        self.n_shotguns = 0
+        self.n_runners = 0
+        self._counts = [[0, 0, 0], [0, 0, 0], [0, 0, 0]]
+        self.counts = ((0, 0, 0), (0, 0, 0), (0, 0, 0))
+
+    @property
+    def dices(self):
+        return self.kept + self.runners
+
+    @dices.setter
+    def dices(self, dices):
+        self.clear()
+        self.add(dices)
+
     def add(self, dices):
-        self.dices += dices
+        counts = self._counts
+        for d in dices:
+            face = d[1]
+            counts[COLOR_INDEX[d[0]]][FACE_INDEX[face]] += 1
+            if face == 'runner':
+                self.runners.append(d)
+                self.n_runners += 1
+            else:
+                self.kept.append(d)
+                if face == 'brain':
+                    self.n_brains += 1
+                else:
+                    self.n_shotguns += 1
+        self.counts = tuple(tuple(c) for c in counts)
+
+    def pick_up_runners(self):
+        """ Take the runners off the table to roll them again, returns their colors """
+        colors = [d[0] for d in self.runners]
+        if colors:
+            self.runners = []
+            self.n_runners = 0
+            for c in self._counts:
+                c[1] = 0
+            self.counts = tuple(tuple(c) for c in self._counts)
+        return colors
+
+    def snapshot(self):
+        return FrozenTable(tuple(self.kept + self.runners), self.n_brains, self.n_shotguns, self.n_runners, self.counts)
+
+FULL_COUNTS = (6, 4, 3)
+
+class Bag(object):
+    """ The dices in the bag, as the number of dices of each color in COLORS.
+
+    draw(n) takes n dices at random without replacement, one at a time with the chance of each color
+    proportional to its count, the same as shuffling the bag and taking the first n.
+    rng is a random.Random like object, the random module by default, or a new one from seed.
+    The bag can also be read as the list of its colors: len(bag), bag.count('Green'), list(bag) ...
+    """
+
+    def __init__(self, counts=FULL_COUNTS, rng=None, seed=None):
+        self.rng = rng if rng is not None else (random.Random(seed) if seed is not None else random)
+        self.fill(counts)
+
+    def fill(self, counts=FULL_COUNTS):
+        self.counts = list(counts)
+        self.n = sum(self.counts)
+        self._view = None
+
+    def refill(self, runner_colors=()):
+        """ Put all the dices back, except the runners that are on the table """
+        self.fill(FULL_COUNTS)
+        for color in runner_colors:
+            self.remove(color)
+
+    def remove(self, color):
+        self.counts[COLOR_INDEX[color]] -= 1
+        self.n -= 1
+        self._view = None
+
+    def draw(self, n):
+        """ Take n dices out of the bag, returns their colors """
+        counts = self.counts
+        colors = []
+        for _ in range(n):
+            r = self.rng.randrange(self.n)
+            c = 0 if r < counts[0] else (1 if r < counts[0] + counts[1] else 2)
+            counts[c] -= 1
+            self.n -= 1
+            colors.append(COLORS[c])
+        self._view = None
+        return colors
+
+    def view(self):
+        """ The bag as a read-only BagView, the same one until the bag changes """
+        if self._view is None:
+            self._view = BagView(self.counts)
+        return self._view
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __getitem__(self, i):
+        return self.view()[i]
+
+    def count(self, color):
+        return self.counts[COLOR_INDEX[color]]
+
+    def __repr__(self):
+        return 'Bag(%s)'%', '.join('%s=%d'%(c, n) for c, n in zip(COLORS, self.counts))
+
+class BagView(tuple):
+    """ The colors of the dices in a bag given to the strategies, a tuple with the counts of each color as counts """
+
+    def __new__(cls, counts):
+        view = tuple.__new__(cls, [c for c, n in zip(COLORS, counts) for _ in range(n)])
+        view.counts = tuple(counts)
+        return view
+
+    def __getnewargs__(self):
+        # pickle and copy make it again from its counts
+        return (self.counts,)
+
+# A read-only copy of a Table given to the strategies
+FrozenTable = collections.namedtuple('FrozenTable', 'dices, n_brains, n_shotguns, n_runners, counts')
+
+STATE_KEYS = ('bag', 'table', 'players', 'playing', 'goal')
+STATE_INDEX = {key: i for i, key in enumerate(STATE_KEYS)}
+
+class GameState(tuple):
+    """ A read-only snapshot of the game given to the strategies, used like the state dict:
+    state['bag'], state['table'], state['players'], state['playing'] and state['goal'], or state.bag ...
+    The bag and the players are tuples and the table a FrozenTable. The game never changes them, it makes new
+    ones when the bag, the table or the scores change, so the players are shared by all the states of a turn. """
+    __slots__ = ()
+
+    def __new__(cls, bag, table, players, playing, goal):
+        return tuple.__new__(cls, (bag, table, players, playing, goal))
+
+    def __getnewargs__(self):
+        return tuple(tuple.__iter__(self))
+
+    bag = property(lambda self: tuple.__getitem__(self, 0))
+    table = property(lambda self: tuple.__getitem__(self, 1))
+    players = property(lambda self: tuple.__getitem__(self, 2))
+    playing = property(lambda self: tuple.__getitem__(self, 3))
+    goal = property(lambda self: tuple.__getitem__(self, 4))
+
+    def __getitem__(self, key):
+        return tuple.__getitem__(self, STATE_INDEX[key])
+
+    def get(self, key, default=None):
+        return tuple.__getitem__(self, STATE_INDEX[key]) if key in STATE_INDEX else default
+
+    def __contains__(self, key):
+        return key in STATE_INDEX
+
+    def __iter__(self):
+        return iter(STATE_KEYS)
+
+    def keys(self):
+        return list(STATE_KEYS)
+
+    def values(self):
+        return list(tuple.__iter__(self))
+
+    def items(self):
+        return list(zip(STATE_KEYS, tuple.__iter__(self)))
+
+    def replace(self, **changes):
+        """ A new state with some of the values changed """
+        return GameState(*[changes.get(key, value) for key, value in self.items()])
+
+    def __repr__(self):
+        return 'GameState(%s)'%', '.join('%s=%r'%item for item in self.items())
 
 
 def main():
@@ -345,16 +547,42 @@ def main():
     parser.add_argument('players', nargs='*', help='Names of Players.')
     parser.add_argument('--goal', type=int, default=13, help='Goal to win the game.')
     parser.add_argument('--fast', action='store_true', help='Run the game in fast mode.')
+    parser.add_argument('--preload', action='store_true', help='Let the strategies load their data in the background.')
     parser.add_argument('-n', '--ngames', type=int, help='Play a number of games to gather statistics.')
     parser.add_argument('--fixorder', action='store_true', help='Fix the order of players in a multi-game series.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of processes for a multi-game series, 0 to use all cores.')
+    parser.add_argument('--seed', type=int, help='Random seed of the game, or master seed of a multi-game series.')
+    parser.add_argument('--rng', choices=dicerng.BACKENDS, default='python', help='Random generator of the dices.')
+    parser.add_argument('--batch', type=int, default=0, help='Games played at the same time in a multi-game series, '
+                        'the strategies with a strategy_batch() decide them together. 0 to play them one by one.')
+    parser.add_argument('--memo-size', type=int, help='Keep at most this many results in each memo cache.')
+    parser.add_argument('--deadline-ms', type=float, help='Time budget of a decision of the searching strategies, in milliseconds.')
+    parser.add_argument('--profile', action='store_true', help='Time the decisions of each player and count the rolls and busts.')
+    parser.add_argument('--memo-stats', action='store_true', help='Print the counters of the memo caches at the end.')
     args = parser.parse_args()
 
+    if args.memo_size is not None:
+        # the worker processes of a series read it from the environment
+        os.environ['ZOMBIE_MEMO_MAXSIZE'] = str(args.memo_size)
+        memocache.configure(args.memo_size)
+    if args.deadline_ms is not None:
+        # read by the strategies when they are imported
+        os.environ['ZOMBIE_DEADLINE_MS'] = str(args.deadline_ms)
+
     # fix the .py after player names
     players = []
     for p in args.players:
         players.append(p[:-3] if p.endswith('.py') else p)
 
-    game = Zombiedice(goal=args.goal, players=players, fastmode=args.fast)
+    rng = None
+    if args.seed is not None or args.rng != 'python':
+        rng = dicerng.make_rng(args.seed, args.rng)
+    game = Zombiedice(goal=args.goal, players=players, fastmode=args.fast, preload=args.preload, rng=rng)
+    profile = None
+    if args.profile:
+        import instrument
+        profile = instrument.Aggregator()
+        game.instruments.append(profile)
     if args.ngames is None:
         game.play()
     else:
@@ -364,25 +592,12 @@ def main():
                 print("%s need a strategy function to enter the auto-play mode. Exiting.."%p.name)
                 return
         print("Gathering result of %d games..."%args.ngames)
-        game.fastmode = 2
-        game_output = open('game_results.txt','w')
-        winner_board = collections.OrderedDict([(p.name, 0) for p in game.players])
-        def playone(i):
-            game_output.write('Game %-4d '%(i+1))
-            game.reset()
-            winners, nround = game.play()
-            game_output.write('Round %2d : '%nround)
-            for w in winners:
-                winner_board[w] += 1
-            game_output.write(' | '.join(['%s %3d'%(p.name, p.score) for p in game.players]) + '\n')
-            game_output.flush()
-        nplayers = len(args.players)
-        for i in range(args.ngames):
-            playone(i)
-            # switch the order of the players
-            if i == args.ngames // nplayers and not args.fixorder:
-                 game.players = game.players[1:] + [game.players[0]]
-        game_output.close()
+        import tournament
+        winner_board, records, seed = tournament.run([p.name for p in game.players], args.ngames, goal=args.goal,
+                                                     jobs=args.jobs, seed=args.seed, fixorder=args.fixorder, profile=profile,
+                                                     backend=args.rng, batch=args.batch)
+        tournament.write_records(records, 'game_results.txt')
+        print("Master seed %d"%seed)
         print("Name    |   Games Won")
         for name, nwin in winner_board.items():
             print("%-7s | %7d"%(name, nwin))
@@ -392,6 +607,10 @@ def main():
             p.finish()
         except:
             pass
+    if profile is not None:
+        profile.dump()
+    if args.memo_stats:
+        memocache.dump()
 
 if __name__ == "__main__":
     main()
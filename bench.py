@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Benchmarks            =
+#==========================
+
+import contextlib, io, json, os, platform, random, sys, time, tracemalloc
+import memocache, packedstate, rolltable, statetable
+from ZombieDice import Zombiedice, find_strategy
+from turndist import FULL_BAG
+
+# Reference workloads, run from the folder of the strategies and their data like ZombieDice.py.
+# The results are written as JSON so that runs can be compared:
+#   cache    : load time and memory of the cachehigh of optimal.py
+#   solver   : states per second of the search of optimal.py from an empty cache
+#   games    : games per second of Zombiedice in silent fast mode, two players of the same strategy
+#   latency  : p50 / p99 of strategy() calls in ms, on states taken from those games. The cold calls start
+#              from empty memo caches and search caches, the warm calls repeat the same states after them.
+# The cachehigh is not changed: its journal is stopped during the benchmark, and the cold calls start from the
+# cachehigh as it was loaded, without the states learned in the games.
+
+STRATEGIES = ['yiwen', 'bruce', 'yudong', 'optimal']
+
+def percentile(values, q):
+    """ The q-th percentile of values, interpolated between the closest ranks """
+    values = sorted(values)
+    if not values:
+        return None
+    x = (len(values) - 1) * q / 100.
+    i = int(x)
+    if i + 1 >= len(values):
+        return values[-1]
+    return values[i] + (values[i+1] - values[i]) * (x - i)
+
+def latency_summary(seconds):
+    ms = [s * 1000. for s in seconds]
+    return {'calls': len(ms), 'p50_ms': percentile(ms, 50), 'p99_ms': percentile(ms, 99),
+            'mean_ms': sum(ms) / len(ms) if ms else None}
+
+def bench_cache():
+    """ Load the cachehigh of optimal.py, with the time and the memory allocated for it """
+    import optimal
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimal.load_cache()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    filename = optimal.load_cache.filename
+    return {'file': filename, 'file_bytes': os.path.getsize(filename) if filename else 0,
+            'states': len(optimal.U_dice.cachehigh), 'load_s': elapsed, 'peak_alloc_bytes': peak}
+
+def bench_solver(scores=(8, 8), goal=13, max_level=5):
+    """ Search the start of a round from an empty cache, the number of states searched per second """
+    import optimal
+    saved = (getattr(optimal.U_dice, 'cachehigh', {}), getattr(optimal.U_dice, 'cachelow', {}),
+             optimal.U_dice.journal, optimal.U_dice.max_level)
+    optimal.U_dice.cachehigh, optimal.U_dice.cachelow, optimal.U_dice.journal = {}, {}, None
+    optimal.U_dice.max_level = max_level
+    try:
+        state = (FULL_BAG, ((0, 0, 0), (0, 0, 0), (0, 0, 0)), tuple(scores), 0, goal, 0)
+        start = time.perf_counter()
+        optimal.U_dice(packedstate.encode(state))
+        elapsed = time.perf_counter() - start
+        n_states = len(optimal.U_dice.cachehigh) + len(optimal.U_dice.cachelow)
+    finally:
+        optimal.U_dice.cachehigh, optimal.U_dice.cachelow, optimal.U_dice.journal, optimal.U_dice.max_level = saved
+    return {'scores': list(scores), 'max_level': max_level, 'states': n_states, 'seconds': elapsed,
+            'states_per_s': n_states / elapsed}
+
+def clear_caches(module):
+    """ Forget what a strategy learned while playing, the data loaded from files is kept """
+    for f in memocache.registry:
+        # the roll table is data read from a file, like the cachehigh
+        if f is not rolltable.roll_table:
+            f.cache.clear()
+    U = getattr(module, 'U_dice', None)
+    if U is not None:
+        U.cachelow = {}
+        if not hasattr(module, 'load_cache'):
+            U.cachehigh = {}
+
+def freeze_cache(module):
+    """ Load the cachehigh of a strategy and stop its journal, so that the benchmark does not change the files.
+    Returns what restore_cache() needs to forget the states learned after it """
+    U = getattr(module, 'U_dice', None)
+    if U is None:
+        return None
+    if hasattr(module, 'load_cache'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.load_cache()
+    cache = getattr(U, 'cachehigh', {})
+    if isinstance(cache, statetable.StateTable):
+        saved = (cache, dict(cache.overflow), cache.n_new)
+    else:
+        saved = (cache, dict(cache), 0)
+    journal = getattr(U, 'journal', None)
+    U.journal = None
+    return saved + (journal,)
+
+def restore_cache(module, saved, journal=False):
+    """ Put back the cachehigh saved by freeze_cache(), and with journal its journal too """
+    if saved is None:
+        return
+    cache, states, n_new, saved_journal = saved
+    if isinstance(cache, statetable.StateTable):
+        cache.overflow = dict(states)
+        cache.n_new = n_new
+    else:
+        cache = dict(states)
+    module.U_dice.cachehigh = cache
+    if journal:
+        module.U_dice.journal = saved_journal
+
+def bench_strategy(name, ngames=100, seconds=30., n_states=200):
+    """ Games per second of a strategy against itself, and the latency of its strategy() calls """
+    module = find_strategy(name)
+    saved = freeze_cache(module)
+    try:
+        return _bench_strategy(module, name, ngames, seconds, n_states, saved)
+    finally:
+        restore_cache(module, saved, journal=True)
+
+def _bench_strategy(module, name, ngames, seconds, n_states, saved):
+    with contextlib.redirect_stdout(io.StringIO()):
+        game = Zombiedice(players=[name + '1', name + '2'], fastmode=2)
+    states = []
+    strategy = module.strategy
+    def recorded(state):
+        if len(states) < n_states:
+            states.append(state)
+        return strategy(state)
+    for p in game.players:
+        p.strategy = recorded
+    n_played = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while n_played < ngames and time.perf_counter() - start < seconds:
+            game.reset()
+            game.play()
+            n_played += 1
+    elapsed = time.perf_counter() - start
+    result = {'games': n_played, 'seconds': elapsed, 'games_per_s': n_played / elapsed}
+    cold = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for state in states:
+            # from the cachehigh as it was loaded, without the states of the games or of the other calls
+            restore_cache(module, saved)
+            clear_caches(module)
+            t = time.perf_counter()
+            strategy(state)
+            cold.append(time.perf_counter() - t)
+        # every state was searched since the last clear, this is the same as after the games
+        for state in states:
+            strategy(state)
+        warm = []
+        for state in states:
+            t = time.perf_counter()
+            strategy(state)
+            warm.append(time.perf_counter() - t)
+    result['latency_cold'] = latency_summary(cold)
+    result['latency_warm'] = latency_summary(warm)
+    return result
+
+def run(strategies=STRATEGIES, ngames=100, seconds=30., n_states=200, seed=0):
+    random.seed(seed)
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(), 'seed': seed, 'ngames': ngames}
+    if 'optimal' in strategies:
+        report['cache'] = bench_cache()
+        report['solver'] = bench_solver()
+    report['strategies'] = {}
+    for name in strategies:
+        report['strategies'][name] = bench_strategy(name, ngames, seconds, n_states)
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser("Benchmark the Zombie Dice game and strategies", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('strategies', nargs='*', default=STRATEGIES, help='Names of the strategies.')
+    parser.add_argument('-n', '--ngames', type=int, default=100, help='Number of games of each strategy.')
+    parser.add_argument('--seconds', type=float, default=30., help='Time limit of the games of each strategy.')
+    parser.add_argument('--states', type=int, default=200, help='Number of strategy() calls timed on cold and warm caches.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the games.')
+    parser.add_argument('-o', '--output', default='bench.json', help='JSON file of the results.')
+    args = parser.parse_args()
+    report = run(args.strategies, args.ngames, args.seconds, args.states, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    print()
@@ -1,20 +1,7 @@
 import itertools
-
-def memo(f):
-    """Decorator that caches the return value for each call to f(args).
-    Then when called again with same args, we can just look it up."""
-    cache = {}
-    def _f(*args):
-        try:
-            return cache[args]
-        except KeyError:
-            cache[args] = result = f(*args)
-            return result
-        except TypeError:
-            # some element of args refuses to be a dict key
-            return f(args)
-    _f.cache = cache
-    return _f
+import numpy as np
+from memocache import memo
+import rolltable
 
 def strategy(state):
     """ Yudong's strategy """
@@ -49,7 +36,35 @@ def strategy(state):
     Your strategy will return either 'hold' or 'roll' based the state.
     Please write code in Python3.
     """
+    state = simple_state(state)
+    if isinstance(state, str):
+        return state
+    bag, runners, shotguns_remain, n_brains = state
+    # the possiblility of getting 3 or more shotguns
+    danger = danger_shot(bag, runners, shotguns_remain)
+    gain = expected_gain(bag, runners)
+    #print("Bruce: I got %f chance to get shot, and get %f brain on average"%(danger, gain))
 
+    # if the danger exceeds the gain, I hold
+    if danger * n_brains > gain:
+        return 'hold'
+    else:
+        return 'roll'
+
+def strategy_batch(states):
+    """ The actions of a list of states of the game, the same as [strategy(state) for state in states].
+    The danger and the gain of all the states are looked up together in the tables of risk_tables() """
+    simple = [simple_state(state) for state in states]
+    rolls = [state for state in simple if not isinstance(state, str)]
+    if rolls:
+        danger, gain, key_index = risk_tables()
+        bag, runners, shotguns_remain, n_brains = (np.array(x) for x in zip(*rolls))
+        k = key_index[tuple(bag.T) + tuple(runners.T)]
+        hold = iter(danger[k, shotguns_remain] * n_brains > gain[k])
+    return [state if isinstance(state, str) else ('hold' if next(hold) else 'roll') for state in simple]
+
+def simple_state(state):
+    """ The action if it is obvious, else (bag, runners, shotguns_remain, n_brains), the dices counted by color """
     # Read information from state
     bag = state['bag']
     table = state['table']
@@ -81,40 +96,33 @@ def strategy(state):
     # Let me think about the possiblility of getting 3 shotguns
     # Number of shotguns remaining
     shotguns_remain = 3 - n_shotguns
-    # the colors of the runners I got
-    runners_color = tuple([ d[0] for d in dices if d[1] == 'runner' ])
-    # the possiblility of getting 3 or more shotguns
-    danger = danger_shot(tuple(bag), runners_color, shotguns_remain)
-    gain = expected_gain(tuple(bag), runners_color)
-    #print("Bruce: I got %f chance to get shot, and get %f brain on average"%(danger, gain))
+    # the colors of the runners I got, and of the dices in the bag, counted as (Green, Yellow, Red)
+    runners_color = [ d[0] for d in dices if d[1] == 'runner' ]
+    runners = tuple(runners_color.count(c) for c in COLORS)
+    bag = tuple(bag.count(c) for c in COLORS)
+    return (bag, runners, shotguns_remain, n_brains)
 
-    # if the danger exceeds the gain, I hold
-    if danger * n_brains > gain:
-        return 'hold'
-    else:
-        return 'roll'
+COLORS = ('Green', 'Yellow', 'Red')
 
 @memo
-def expected_gain(bag, runners_color):
+def expected_gain(bag, runners):
+    """ The average number of brains of the next roll, the dices drawn from the bag counted as drawn with replacement """
     dice_brain_p = {'Green': 0.5, 'Yellow': 0.33333333, 'Red': 0.1666666667}
-    n_draw = 3 - len(runners_color)
-    runners_gain = sum([dice_brain_p[c] for c in runners_color])
+    n_draw = 3 - sum(runners)
+    runners_gain = sum([n * dice_brain_p[c] for c, n in zip(COLORS, runners)])
     if n_draw > 0:
-        return runners_gain + n_draw * sum([dice_brain_p[c] for c in bag]) / len(bag)
+        return runners_gain + n_draw * sum([n * dice_brain_p[c] for c, n in zip(COLORS, bag)]) / sum(bag)
     else:
         return runners_gain
 
-
 @memo
-def danger_shot(bag, runners_color, shotguns_remain):
-    if len(runners_color) < 3:
-        possible_draws_from_bag = itertools.combinations(bag, 3-len(runners_color))
-        shot_p_list = []
-        for draw in possible_draws_from_bag:
-            shot_p_list.append( shot_probability(runners_color+draw, shotguns_remain) )
-        return sum(shot_p_list) / len(shot_p_list)
-    else:
-        return shot_probability(runners_color, shotguns_remain)
+def danger_shot(bag, runners, shotguns_remain):
+    """ The possiblility of getting shotguns_remain or more shotguns in the next roll, averaged over the draws """
+    return sum(p_draw * shot_probability(hand_colors(runners, draw), shotguns_remain)
+               for draw, p_draw, _ in rolltable.draws(bag, runners))
+
+def hand_colors(runners, draw):
+    return tuple(c for c, n_runners, n_draw in zip(COLORS, runners, draw) for _ in range(n_runners + n_draw))
 
 @memo
 def shot_probability(colors, shotguns_remain):
@@ -128,3 +136,16 @@ def shot_probability(colors, shotguns_remain):
         if faces.count('shotgun') >= shotguns_remain:
             n_shot += 1
     return n_shot / 216.
+
+@memo
+def risk_tables():
+    """ danger_shot and expected_gain of every key of rolltable, as arrays (danger[key, shotguns_remain], gain[key])
+    with the key_index of the table """
+    table = rolltable.roll_table()
+    danger = np.ones((len(table.keys), 4))
+    gain = np.zeros(len(table.keys))
+    for k, (bag, runners) in enumerate(table.keys):
+        for shotguns_remain in (1, 2, 3):
+            danger[k, shotguns_remain] = danger_shot(bag, runners, shotguns_remain)
+        gain[k] = expected_gain(bag, runners)
+    return danger, gain, table.key_index
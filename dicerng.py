@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Random Generators     =
+#==========================
+
+import itertools, random
+
+# The random generators of the games. The game and the engine only call rng.random(), rng.randrange(n) and
+# rng.choice(seq), the methods of random.Random, so any random.Random like object can be used:
+#   python : random.Random, one Mersenne Twister call for each dice drawn from the bag and each face rolled
+#   numpy  : NumpyRandom, the numbers are generated by a NumPy Generator in chunks and handed out one by one,
+#            a lot faster over millions of rolls. NumPy is only imported when it is used.
+# make_rng(seed, backend, stream) gives the generator of a stream, the streams of the same seed are independent.
+
+BACKENDS = ('python', 'numpy')
+
+class NumpyRandom(object):
+    """ A random.Random like generator reading uniform numbers from a buffer filled by a NumPy Generator.
+
+    seed : an int, a numpy.random.SeedSequence, or None for a random seed.
+    chunk : how many numbers are generated at once.
+    """
+
+    def __init__(self, seed=None, chunk=1<<16):
+        import numpy as np
+        self.seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.generator = np.random.Generator(np.random.PCG64(self.seed_seq))
+        self.chunk = chunk
+        self.n_chunks = 0
+        # the numbers as python floats, so that taking one is a single C call
+        self._next = itertools.chain.from_iterable(self._chunks()).__next__
+
+    def _chunks(self):
+        while True:
+            self.n_chunks += 1
+            yield self.generator.random(self.chunk).tolist()
+
+    def random(self):
+        return self._next()
+
+    def randrange(self, n):
+        return int(self._next() * n)
+
+    def choice(self, seq):
+        return seq[int(self._next() * len(seq))]
+
+    def spawn(self, n):
+        """ n new generators with streams independent of this one and of each other """
+        return [NumpyRandom(s, self.chunk) for s in self.seed_seq.spawn(n)]
+
+def make_rng(seed=None, backend='python', stream=None):
+    """ The generator of a stream of seed, the same numbers for the same arguments.
+    Different streams of a seed are independent, e.g. one for each game of a tournament. """
+    if backend == 'python':
+        if stream is None:
+            return random.Random(seed)
+        return random.Random('%d:%d'%(seed, stream))
+    elif backend == 'numpy':
+        import numpy as np
+        if stream is None:
+            return NumpyRandom(seed)
+        return NumpyRandom(np.random.SeedSequence(seed, spawn_key=(stream,)))
+    raise ValueError('Unknown random backend %s, use one of %s'%(backend, ', '.join(BACKENDS)))
@@ -1,27 +1,18 @@
 #!/usr/bin/env python3
 
 import os, pickle
-import sys
+import optimal
 
 cachefilename = 'cachehigh'
 
+# optimal looks up every state under its canonical state, so instead of keeping the states that have
+# the same value, the cache only keeps one canonical state for all of them
 if os.path.exists(cachefilename):
     cachehigh = pickle.load( open(cachefilename,"rb") )
     print('Successfully loaded %d high quality cache data'%len(cachehigh))
-    new_cache = {}
-    count = 0
-    for state, result in cachehigh.items():
-        new_cache[state] = result
-        bag, dices, players, myidx, goal, me = state
-        if me == 0:
-            state1 = (bag, dices, players, myidx, goal, 1)
-            result1 = ( 1.-result[0], result[1] )
-            new_cache[state1] = result1
-            count += 1
-            #if count < 10:
-            #    print(state1, result1)
-    print("Duplicated %d results for player 1."%count)
+    new_cache = optimal.canonical_cache(cachehigh)
+    print("Merged %d states into their canonical states."%(len(cachehigh) - len(new_cache)))
 
-# save the highcache to pickled file
-pickle.dump( new_cache, open(cachefilename,"wb") )
-print('Successfully updated cachehigh data, %d '%len(new_cache))
+    # save the highcache to pickled file
+    pickle.dump( new_cache, open(cachefilename,"wb") )
+    print('Successfully updated cachehigh data, %d '%len(new_cache))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Headless Game Engine  =
+#==========================
+
+import random, collections, time
+from ZombieDice import DICETYPE, SimplePlayer, Dice, Table, Bag
+
+TurnResult = collections.namedtuple('TurnResult', 'brains, shotguns, rolls, busted')
+GameResult = collections.namedtuple('GameResult', 'winners, rounds, scores')
+
+# every (color, face) dice is created once and shared by all the tables
+DICES = {(c, f): Dice(c, f) for c in DICETYPE for f in set(DICETYPE[c])}
+# the dices of the faces of each color, in the order of DICETYPE, so a roll picks one of them
+DICE_FACES = {c: [DICES[c, f] for f in DICETYPE[c]] for c in DICETYPE}
+
+class Engine(object):
+    """ A pure simulation core of the Zombie Dice game.
+
+    It follows the same rules as Zombiedice.play(), but does not print, sleep or draw anything,
+    and returns the results as namedtuples. The bag, the table and the state dict passed to the
+    strategies are created once and updated in place, so strategies should treat them as read-only.
+    play_game() calls the strategies one decision at a time, game_steps() hands the decisions out to
+    play_batch(), which plays many games at once and decides their states in batches.
+
+    players : a list of (name, strategy) tuples, in the playing order.
+    rng : a random.Random like object used to draw dices from the bag and roll them, see dicerng.py.
+    instruments : objects called around the game loop, see instrument.py.
+    """
+
+    def __init__(self, players, goal=13, rng=None, instruments=None):
+        self.names = [name for name, _ in players]
+        self.strategies = [strategy for _, strategy in players]
+        self.goal = goal
+        self.rng = rng if rng is not None else random.Random()
+        self.scores = [0] * len(self.names)
+        self.bag = Bag(rng=self.rng)
+        self.table = Table()
+        self.instruments = list(instruments) if instruments else []
+
+    def emit(self, event, *args):
+        for instrument in self.instruments:
+            getattr(instrument, event)(*args)
+
+    def reset(self):
+        self.scores = [0] * len(self.names)
+        self.i_round = 0
+
+    def turn_steps(self, idx):
+        """ The turn of the player idx as a generator: it yields the state of each decision and is sent the move,
+        the TurnResult is the value of its StopIteration. play_turn() and play_batch() send the moves """
+        rng = self.rng
+        choice = rng.choice
+        bag = self.bag
+        bag.rng = rng
+        bag.fill()
+        table = self.table
+        table.clear()
+        players = [SimplePlayer(name, score) for name, score in zip(self.names, self.scores)]
+        state = {'bag':bag.view(), 'table':table, 'players':players, 'playing':players[idx], 'goal':self.goal}
+        instruments = self.instruments
+        rolls = 0
+        while True:
+            move = yield state
+            if move == 'hold':
+                n_brains = table.n_brains
+                self.scores[idx] += n_brains
+                if instruments:
+                    self.emit('turn', self.names[idx], n_brains, False)
+                return TurnResult(n_brains, table.n_shotguns, rolls, False)
+            elif move == 'roll':
+                rolls += 1
+                # pick up the runners and draw dices from bag so we have 3 in hand
+                runner_colors = table.pick_up_runners()
+                n_draw = 3 - len(runner_colors)
+                dice_colors = runner_colors + bag.draw(n_draw)
+                dices = [choice(DICE_FACES[c]) for c in dice_colors]
+                table.add(dices)
+                if instruments:
+                    self.emit('roll', self.names[idx], dices)
+                n_shotguns = table.n_shotguns
+                if n_shotguns > 2:
+                    if instruments:
+                        self.emit('turn', self.names[idx], 0, True)
+                    return TurnResult(0, n_shotguns, rolls, True)
+                # put all dices back if the bag is empty, except the runners
+                runner_colors = [d[0] for d in dices if d[1] == 'runner']
+                if len(bag) < 3 - len(runner_colors):
+                    bag.refill(runner_colors)
+                state['bag'] = bag.view()
+            else:
+                raise RuntimeError('%s is not a valid move!'%move)
+
+    def play_turn(self, idx):
+        """ Play one turn for the player idx, return a TurnResult """
+        instruments = self.instruments
+        if instruments:
+            start = time.perf_counter()
+        strategy = self.strategies[idx]
+        steps = self.turn_steps(idx)
+        send = steps.send
+        state = next(steps)
+        if instruments:
+            # the state is built once for the turn
+            state_seconds = time.perf_counter() - start
+        try:
+            while True:
+                if instruments:
+                    start = time.perf_counter()
+                    move = strategy(state)
+                    self.emit('decision', self.names[idx], move, time.perf_counter() - start, state_seconds)
+                    state_seconds = 0.
+                else:
+                    move = strategy(state)
+                send(move)
+        except StopIteration as stop:
+            return stop.value
+
+    def round_over(self):
+        """ The GameResult if someone reached the goal at the end of a round, or None to play another round """
+        # check if anyone wins, if multiple people reached goal, the highest wins
+        max_score = max(self.scores)
+        if max_score >= self.goal:
+            winners = [name for name, score in zip(self.names, self.scores) if score == max_score]
+            return GameResult(winners, self.i_round, tuple(self.scores))
+        return None
+
+    def play_game(self):
+        """ Play a full game from zero scores, return a GameResult """
+        self.reset()
+        if self.instruments:
+            start = time.perf_counter()
+        while True:
+            self.i_round += 1
+            for idx in range(len(self.names)):
+                self.play_turn(idx)
+            result = self.round_over()
+            if result is not None:
+                if self.instruments:
+                    self.emit('game', result.winners, result.rounds, time.perf_counter() - start)
+                return result
+
+    def game_steps(self):
+        """ A full game from zero scores as a generator: it yields (idx, state) for each decision of the player idx
+        and is sent the move, the GameResult is the value of its StopIteration """
+        self.reset()
+        if self.instruments:
+            start = time.perf_counter()
+        while True:
+            self.i_round += 1
+            for idx in range(len(self.names)):
+                steps = self.turn_steps(idx)
+                state = next(steps)
+                try:
+                    while True:
+                        move = yield idx, state
+                        steps.send(move)
+                except StopIteration:
+                    pass
+            result = self.round_over()
+            if result is not None:
+                if self.instruments:
+                    self.emit('game', result.winners, result.rounds, time.perf_counter() - start)
+                return result
+
+def play_batch(engines, batch_strategies=None, size=256):
+    """ Play the games of the engines, size of them at the same time, and yield (i, GameResult) as the game
+    of engines[i] ends. The decisions waiting in the running games are collected at each step, and those of
+    a player with a function in batch_strategies (name -> strategy_batch) are made in a single call:
+    strategy_batch(states) is given the list of their states and returns the list of the moves.
+    The other players are asked one state at a time with their strategy(state).
+    Each game needs its own Engine, as the states given in a batch are read at the same time. """
+    batch_strategies = batch_strategies or {}
+    engines = enumerate(engines)
+    # the running games: [i, engine, steps, idx, state]
+    running = []
+    def start_games():
+        while len(running) < size:
+            try:
+                i, engine = next(engines)
+            except StopIteration:
+                return
+            steps = engine.game_steps()
+            idx, state = next(steps)
+            running.append([i, engine, steps, idx, state])
+    start_games()
+    while running:
+        moves = {}
+        batches = {}
+        for game in running:
+            i, engine, steps, idx, state = game
+            batch = batch_strategies.get(engine.names[idx])
+            if batch is not None:
+                batches.setdefault(batch, []).append(game)
+            elif engine.instruments:
+                start = time.perf_counter()
+                moves[i] = move = engine.strategies[idx](state)
+                engine.emit('decision', engine.names[idx], move, time.perf_counter() - start, 0.)
+            else:
+                moves[i] = engine.strategies[idx](state)
+        for batch, games in batches.items():
+            start = time.perf_counter()
+            batch_moves = batch([game[4] for game in games])
+            seconds = (time.perf_counter() - start) / len(games)
+            for game, move in zip(games, batch_moves):
+                moves[game[0]] = move
+                engine = game[1]
+                if engine.instruments:
+                    # the time of the batch is shared by its decisions
+                    engine.emit('decision', engine.names[game[3]], move, seconds, 0.)
+        still_running = []
+        for game in running:
+            try:
+                game[3], game[4] = game[2].send(moves[game[0]])
+                still_running.append(game)
+            except StopIteration as stop:
+                yield game[0], stop.value
+        running[:] = still_running
+        start_games()
@@ -3,7 +3,9 @@
 
 import itertools, time, copy
 import collections, random
-import os, pickle
+import os, pickle, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import journal
 
 def memo(f):
     """Decorator that caches the return value for each call to f(args).
@@ -287,6 +289,7 @@ def U_dice(state, level=0, quality=0.):
             print(' ---> ', end='')
             print((result, quality))
             U_dice.cachehigh[state] = (result, quality)
+            U_dice.journal.record(state, (result, quality))
         else:
             # go back to the previous result
             result, quality = U_dice.cachehigh[state]
@@ -295,6 +298,7 @@ def U_dice(state, level=0, quality=0.):
             print(state, end='')
             print((result, quality))
             U_dice.cachehigh[state] = (result, quality)
+            U_dice.journal.record(state, (result, quality))
         else:
             U_dice.cachelow[state] = (result, quality)
 
@@ -384,6 +388,13 @@ if os.path.exists('cachehigh'):
 else:
     n_exist = 0
     print("cachehigh is not found, I will be very stupid!")
+# replay the improvements of the runs that were not merged into cachehigh, then keep adding to the journal
+if not hasattr(U_dice, 'cachehigh'):
+    U_dice.cachehigh = {}
+n_replayed = journal.replay(journal.journal_filename('cachehigh'), U_dice.cachehigh)
+if n_replayed:
+    print('Recovered %d states from %s'%(n_replayed, journal.journal_filename('cachehigh')))
+U_dice.journal = journal.Journal(journal.journal_filename('cachehigh'))
 
 # improving
 if __name__ == '__main__':
@@ -404,5 +415,7 @@ if __name__ == '__main__':
         print('Starting computing from state', state)
         U_dice(state, level=0)
 
-    pickle.dump( U_dice.cachehigh, open(cachefilename,"wb") )
-    print('Successfully updated U_dice.cachehigh data')
+    # the improvements were checkpointed into the journal, merge it into cachehigh now
+    U_dice.journal.close()
+    n_merged = journal.compact(cachefilename)
+    print('Successfully updated U_dice.cachehigh data with %d states'%n_merged)
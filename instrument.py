@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Game Instrumentation  =
+#==========================
+
+import sys
+
+# Zombiedice and Engine call the objects in their instruments list around the game loop:
+#   decision(name, move, seconds, state_seconds) : after a strategy() call, with the time it took and the
+#                                                  time spent building the state given to it
+#   roll(name, dices)                            : after the dices of a roll are on the table
+#   turn(name, brains, busted)                   : at the end of a turn, with the brains banked
+#   game(winners, rounds, seconds)               : at the end of a game
+# With an empty list nothing is timed or called. Aggregator is an instrument that sums all of them up in memory.
+# The games of engine.play_batch() are played at the same time, so their seconds add up to more than the run took,
+# and a decision made in a batch is given its share of the time of the batch.
+
+class PlayerStats(object):
+    """ The counters of a player """
+    __slots__ = ('decisions', 'decision_s', 'max_decision_s', 'state_s', 'rolls', 'busts', 'turns', 'brains')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+class Aggregator(object):
+    """ Sum up the events of the games by player """
+
+    def __init__(self):
+        self.players = {}
+        self.games = 0
+        self.rounds = 0
+        self.game_s = 0.
+
+    def player(self, name):
+        try:
+            return self.players[name]
+        except KeyError:
+            self.players[name] = stats = PlayerStats()
+            return stats
+
+    def decision(self, name, move, seconds, state_seconds):
+        stats = self.player(name)
+        stats.decisions += 1
+        stats.decision_s += seconds
+        stats.max_decision_s = max(stats.max_decision_s, seconds)
+        stats.state_s += state_seconds
+
+    def roll(self, name, dices):
+        self.player(name).rolls += 1
+
+    def turn(self, name, brains, busted):
+        stats = self.player(name)
+        stats.turns += 1
+        stats.brains += brains
+        stats.busts += busted
+
+    def game(self, winners, rounds, seconds):
+        self.games += 1
+        self.rounds += rounds
+        self.game_s += seconds
+
+    def export(self):
+        """ The counters as a dict of plain numbers, for JSON or for merge() in another process """
+        return {'games': self.games, 'rounds': self.rounds, 'game_s': self.game_s,
+                'players': {name: {k: getattr(s, k) for k in PlayerStats.__slots__} for name, s in self.players.items()}}
+
+    def merge(self, exported):
+        """ Add the counters exported by another Aggregator """
+        self.games += exported['games']
+        self.rounds += exported['rounds']
+        self.game_s += exported['game_s']
+        for name, counters in exported['players'].items():
+            stats = self.player(name)
+            for k, v in counters.items():
+                setattr(stats, k, max(getattr(stats, k), v) if k == 'max_decision_s' else getattr(stats, k) + v)
+
+    def dump(self, file=None):
+        """ Print the counters, the slowest strategy first """
+        file = file or sys.stdout
+        print("%d games, %d rounds, %.2f s"%(self.games, self.rounds, self.game_s), file=file)
+        print("%-12s %10s %10s %10s %10s %10s %8s %8s %8s"%('Player', 'Decisions', 'Total s', 'Mean ms', 'Max ms',
+                                                           'State ms', 'Rolls', 'Busts', 'Turns'), file=file)
+        rows = sorted(self.players.items(), key=lambda item: item[1].decision_s, reverse=True)
+        for name, s in rows:
+            n = max(s.decisions, 1)
+            print("%-12s %10d %10.3f %10.4f %10.3f %10.4f %8d %8d %8d"%(name[:12], s.decisions, s.decision_s,
+                  1000. * s.decision_s / n, 1000. * s.max_decision_s, 1000. * s.state_s / n, s.rolls, s.busts, s.turns), file=file)
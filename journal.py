@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Cache Journal         =
+#==========================
+
+import os, pickle, time
+
+# A journal is an append-only file next to a cache file, 'cachehigh' has 'cachehigh.journal'.
+# The states added to the cache are written into it in batches, each batch is one pickled list of
+# (state, (result, quality)) pairs, so a checkpoint only costs the new states.
+# If a run crashes in the middle of a batch, only that last batch is lost, replay() stops there.
+# The journal is merged into the cache file offline by compact(), which then removes it.
+
+def journal_filename(filename):
+    return filename + '.journal'
+
+class Journal(object):
+    """ Append the states added to a cache, flushed to the disk every interval seconds """
+
+    def __init__(self, filename, interval=30.):
+        self.filename = filename
+        self.interval = interval
+        self.pending = []
+        self.n_written = 0
+        self.last_flush = time.time()
+        # the file is only created when there is something to write into it
+        self.file = None
+
+    def open(self):
+        self.file = open(self.filename, 'ab')
+        # cut the last batch of a crashed run, or the batches written after it could not be replayed
+        self.file.truncate(replay(self.filename, {}, size=True))
+
+    def record(self, state, result):
+        self.pending.append((state, result))
+        if time.time() - self.last_flush > self.interval:
+            self.flush()
+
+    def flush(self):
+        """ Write the pending states, after this they survive a crash """
+        if self.pending:
+            if self.file is None:
+                self.open()
+            pickle.dump(self.pending, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.n_written += len(self.pending)
+            self.pending = []
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+def replay(filename, cache, size=False):
+    """ Put the states of a journal into cache, the later ones win. Returns the number of states,
+    or with size the number of bytes of the complete batches. """
+    n_states = 0
+    end = 0
+    if not os.path.exists(filename):
+        return 0
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError, ValueError):
+                # the end of the journal, or the last batch of a crashed run
+                break
+            for state, result in batch:
+                cache[state] = result
+            n_states += len(batch)
+            end = f.tell()
+    return end if size else n_states
+
+def compact(filename):
+    """ Merge the journal of a cache file into it, the cache file keeps its format """
+    import gzip, statetable
+    journal = journal_filename(filename)
+    if filename.endswith('.zdt'):
+        cache = statetable.StateTable.open(filename) if os.path.exists(filename) else statetable.StateTable()
+    elif os.path.exists(filename):
+        cache = pickle.load(gzip.open(filename, 'rb') if filename.endswith('.gz') else open(filename, 'rb'))
+    else:
+        cache = {}
+    n_states = replay(journal, cache)
+    if n_states == 0:
+        return 0
+    if isinstance(cache, statetable.StateTable):
+        cache.save(filename)
+    else:
+        pickle.dump(cache, gzip.open(filename, 'wb') if filename.endswith('.gz') else open(filename, 'wb'))
+    os.remove(journal)
+    return n_states
+
+if __name__ == '__main__':
+    import sys
+    # compact the journals of cache files, offline
+    for filename in sys.argv[1:] or ['cachehigh']:
+        start = time.time()
+        n_states = compact(filename)
+        print('Merged %d states from %s into %s in %.2f s'%(n_states, journal_filename(filename), filename, time.time() - start))
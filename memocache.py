@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Memo Caches           =
+#==========================
+
+import os, sys, collections
+from functools import update_wrapper
+
+# The memo decorator shared by the game and the strategies. Every memoized function keeps its own cache,
+# which can be capped to a number of entries; then the least recently used entry is evicted first.
+# The default cap is unlimited, it can be set with the ZOMBIE_MEMO_MAXSIZE environment variable or
+# configure(), e.g. to keep the memory of a long running tournament worker bounded.
+
+DEFAULT_MAXSIZE = int(os.environ['ZOMBIE_MEMO_MAXSIZE']) if os.environ.get('ZOMBIE_MEMO_MAXSIZE') else None
+
+# all the memoized functions, in the order they were defined
+registry = []
+
+class MemoStats(object):
+    """ The counters of a memoized function """
+    __slots__ = ('name', 'hits', 'misses', 'evictions')
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+def memo(f=None, maxsize=None):
+    """Decorator that caches the return value for each call to f(args).
+    Then when called again with same args, we can just look it up.
+    With maxsize, or a default maxsize from configure(), only that many results are kept, the least recently
+    used ones are dropped. Used as @memo or @memo(maxsize=100000)."""
+    if f is None:
+        return lambda f: memo(f, maxsize)
+    cache = collections.OrderedDict()
+    stats = MemoStats('%s.%s'%(f.__module__, f.__qualname__))
+    def _f(*args):
+        try:
+            result = cache[args]
+        except KeyError:
+            stats.misses += 1
+            cache[args] = result = f(*args)
+            if _f.maxsize is not None and len(cache) > _f.maxsize:
+                cache.popitem(last=False)
+                stats.evictions += 1
+            return result
+        except TypeError:
+            # some element of args refuses to be a dict key
+            return f(*args)
+        stats.hits += 1
+        if _f.maxsize is not None:
+            cache.move_to_end(args)
+        return result
+    update_wrapper(_f, f)
+    _f.cache = cache
+    _f.stats = stats
+    _f.maxsize = maxsize if maxsize is not None else DEFAULT_MAXSIZE
+    _f.fixed_maxsize = maxsize is not None
+    registry.append(_f)
+    return _f
+
+def configure(maxsize=None):
+    """ Set the default maxsize of the memo caches, also of the ones defined already without their own maxsize.
+    The caches over the new size are cut down to it. """
+    global DEFAULT_MAXSIZE
+    DEFAULT_MAXSIZE = maxsize
+    for f in registry:
+        if not f.fixed_maxsize:
+            f.maxsize = maxsize
+            trim(f)
+
+def trim(f):
+    """ Evict the least recently used entries of a memoized function over its maxsize """
+    while f.maxsize is not None and len(f.cache) > f.maxsize:
+        f.cache.popitem(last=False)
+        f.stats.evictions += 1
+
+def clear():
+    """ Empty all the memo caches, the counters are kept """
+    for f in registry:
+        f.cache.clear()
+
+def sizeof(obj, seen=None):
+    """ The approximate memory used by an object with the tuples, lists, dicts and sets inside it,
+    shared objects are counted once """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(k, seen) + sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        size += sum(sizeof(x, seen) for x in obj)
+    return size
+
+def stats():
+    """ The counters of every memoized function, as a list of dicts, the bytes are measured now """
+    result = []
+    for f in registry:
+        s = f.stats
+        calls = s.hits + s.misses
+        result.append({'name': s.name, 'entries': len(f.cache), 'maxsize': f.maxsize, 'hits': s.hits,
+                       'misses': s.misses, 'evictions': s.evictions, 'hit_rate': s.hits / calls if calls else 0.,
+                       'bytes': sizeof(f.cache)})
+    return result
+
+def dump(file=None):
+    """ Print the counters of the memoized functions that were called, the most used first """
+    file = file or sys.stdout
+    rows = [s for s in stats() if s['hits'] + s['misses'] > 0]
+    rows.sort(key=lambda s: s['hits'] + s['misses'], reverse=True)
+    print("%-36s %9s %11s %11s %9s %6s %11s"%('Memo', 'Entries', 'Hits', 'Misses', 'Evicted', 'Hit%', 'Bytes'), file=file)
+    for s in rows:
+        print("%-36s %9d %11d %11d %9d %5.1f%% %11d"%(s['name'][-36:], s['entries'], s['hits'], s['misses'],
+                                                      s['evictions'], 100 * s['hit_rate'], s['bytes']), file=file)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Opening Book          =
+#==========================
+
+import itertools, os, time
+import numpy as np
+import solver, statetable, packedstate
+from statetable import MAX_OVER
+
+# The best action of every turn state of optimal.py in the early game, one bit each: 1 to roll, 0 to hold.
+# A book covers one number of players and goal, and the states where me is playing and every score is at
+# most bound. The actions are taken from the exact solution of solver.py, only the bits are kept.
+#
+# The bits are grouped in blocks, one for each (players, me) in the order of itertools.product, then me.
+# A block has the turn states of statetable with at most max_score - players[me] brains, in their order,
+# offsets gives where each block starts.
+
+def book_filename(n_players, goal):
+    return 'book_%d_%d.npz'%(n_players, goal)
+
+class OpeningBook(object):
+    """ The policy bitmap of the early game, built by build() or read by load() """
+
+    def __init__(self, n_players, goal, bound, bits, offsets):
+        self.n_players = n_players
+        self.goal = goal
+        self.bound = bound
+        self.max_score = statetable.max_score(goal)
+        self.key_index, self.turn_index, self.n_upto = statetable.turn_positions(self.max_score)
+        self.bits = bits
+        self.offsets = offsets
+
+    def block(self, players, me):
+        """ The number of the block of (players, me), the scores have to be within bound """
+        block = 0
+        for score in players:
+            block = block * (self.bound+1) + score
+        return block * self.n_players + me
+
+    def action(self, state):
+        """ The best action of a state of optimal.py, or None if it is not in the book """
+        bag, dices, players, myidx, goal, me = state
+        if myidx != me or goal != self.goal or len(players) != self.n_players or max(players) > self.bound:
+            return None
+        k = self.key_index[tuple(bag) + tuple(d[1] for d in dices)]
+        brains = sum(d[0] for d in dices)
+        shotguns = sum(d[2] for d in dices)
+        if k < 0 or shotguns > 2 or players[me] + brains > self.max_score:
+            return None
+        position = self.turn_index[k, shotguns, brains]
+        if position < 0:
+            return None
+        i = self.offsets[self.block(players, me)] + position
+        return 'roll' if (self.bits[i >> 3] >> (7 - (i & 7))) & 1 else 'hold'
+
+    def actions(self, turns, players, me):
+        """ The best actions of many states of the game of the book at once, as an array of 1 to roll,
+        0 to hold or -1 for the states that are not in the book.
+        turns : the turns of the states packed by packedstate, players : the scores of each state in a row,
+        me : the player of each state, who is playing """
+        turns, players, me = np.asarray(turns, dtype=np.int64), np.asarray(players, dtype=np.int64), np.asarray(me, dtype=np.int64)
+        def field(shift, bits):
+            return (turns >> shift) & ((1 << bits) - 1)
+        key = tuple(field(packedstate.BAG[c], 2 if c == 2 else 3) for c in range(3)) + \
+              tuple(field(packedstate.RUNNERS[c], 2) for c in range(3))
+        k = self.key_index[key]
+        brains, shotguns = field(packedstate.BRAINS, 6), field(packedstate.SHOTGUNS, 3)
+        found = (k >= 0) & (shotguns <= 2) & (players.max(axis=1) <= self.bound) & \
+                (players[np.arange(len(me)), me] + brains <= self.max_score)
+        position = np.where(found, self.turn_index[k, np.minimum(shotguns, 2), np.minimum(brains, self.max_score)], -1)
+        found &= position >= 0
+        block = np.zeros(len(me), dtype=np.int64)
+        for score in players.T:
+            block = block * (self.bound+1) + np.minimum(score, self.bound)
+        i = np.where(found, self.offsets[block * self.n_players + me] + position, 0)
+        bits = (self.bits[i >> 3] >> (7 - (i & 7))) & 1
+        return np.where(found, bits, -1)
+
+    def save(self, filename):
+        np.savez(filename, header=np.array([self.n_players, self.goal, self.bound]), bits=self.bits, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            n_players, goal, bound = (int(x) for x in data['header'])
+            return cls(n_players, goal, bound, data['bits'], data['offsets'])
+
+def roll_pairs(solution):
+    """ For every roll from every turn state, in the order of the turn positions:
+    (position, probability, position after the roll or -1 for a bust) """
+    g = solution.graph
+    turns = np.argwhere(solution.turn_index >= 0)
+    k, s, b = turns[np.argsort(solution.turn_index[solution.turn_index >= 0])].T
+    positions, p, after = [], [], []
+    for position in range(len(k)):
+        edges = g.edges(k[position])
+        safe = g.shotguns[edges] < 3 - s[position]
+        brains = np.minimum(b[position] + g.brains[edges], solution.max_score)
+        dst = solution.turn_index[g.dst[edges], np.minimum(s[position] + g.shotguns[edges], 2), brains]
+        positions.append(np.full(len(g.p[edges]), position))
+        p.append(g.p[edges])
+        after.append(np.where(safe, dst, -1))
+    return np.concatenate(positions), np.concatenate(p), np.concatenate(after), b
+
+def block_bits(solution, scores, pairs):
+    """ The roll bits of the turn states of me with scores, the same actions as solution.action() """
+    me = solution.me
+    size = solution.n_upto[solution.max_score - scores[me]]
+    positions, p, after, b = pairs
+    n = np.searchsorted(positions, size)
+    positions, p, after, b = positions[:n], p[:n], after[:n], b[:size]
+    values = solution.tables[scores, me]
+    bust = solution.next_value(scores, me+1)
+    # a roll to a state past the block only comes from a turn that has to hold anyway
+    after = np.where(after < size, after, -1)
+    roll = np.bincount(positions, weights=p * np.where(after >= 0, values[np.maximum(after, 0)], bust), minlength=size)
+    hold = np.array(solution.hold_values(scores, me))[b]
+    bits = roll > hold
+    bits[b == 0] = True
+    bits[scores[me] + b > solution.goal + MAX_OVER] = False
+    return bits
+
+def solved_blocks(n_players, goal, bound, me, pairs=None, verbose=False):
+    """ The roll bits of me for every scores up to bound, {scores: bits}. The game is solved for me, and the
+    tables of the turns are dropped as soon as they are final, so only the roots stay in memory """
+    solution = solver.Solution(n_players, goal, me)
+    pairs = roll_pairs(solution) if pairs is None else pairs
+    blocks = {}
+    def solved(scores):
+        if max(scores) <= bound:
+            blocks[scores] = block_bits(solution, scores, pairs)
+        for i in range(n_players):
+            solution.tables.pop((scores, i), None)
+    if verbose:
+        print('Solving the game of %d players to goal %d for player %d'%(n_players, goal, me))
+    solution.solve(solved=solved)
+    return blocks
+
+def build(n_players=2, goal=13, bound=None, verbose=False):
+    """ The OpeningBook of the states with all the scores up to bound, goal - 1 by default.
+    The actions come from the solved game file if there is one, else the game is solved exactly for every player,
+    once and offline: a few minutes for 2 players, hours for 3, and far too long for 4 players. """
+    bound = goal - 1 if bound is None else bound
+    filename = solver.solution_filename(n_players, goal)
+    if os.path.exists(filename):
+        solutions = [solver.Solution.load(filename, me) for me in range(n_players)]
+        pairs = roll_pairs(solutions[0])
+        def bits(scores, me):
+            return block_bits(solutions[me], scores, pairs)
+    else:
+        solved = [solved_blocks(n_players, goal, bound, me, verbose=verbose) for me in range(n_players)]
+        def bits(scores, me):
+            return solved[me][scores]
+    blocks, offsets = [], []
+    start = 0
+    for scores in itertools.product(range(bound+1), repeat=n_players):
+        for me in range(n_players):
+            offsets.append(start)
+            blocks.append(bits(scores, me))
+            start += len(blocks[-1])
+    book = OpeningBook(n_players, goal, bound, np.packbits(np.concatenate(blocks)), np.array(offsets, dtype=np.int64))
+    if verbose:
+        print('%d blocks, %d states in %d bytes'%(len(offsets), start, len(book.bits)))
+    return book
+
+def find_book(n_players, goal):
+    """ The opening book from the current folder, or None if it has not been built """
+    if not hasattr(find_book, 'cache'):
+        find_book.cache = {}
+    key = (n_players, goal)
+    if key not in find_book.cache:
+        filename = book_filename(n_players, goal)
+        find_book.cache[key] = OpeningBook.load(filename) if os.path.exists(filename) else None
+    return find_book.cache[key]
+
+def book_action(state):
+    """ The best action of a state of optimal.py from the opening book, or None if it is not in the book """
+    bag, dices, players, myidx, goal, me = state
+    book = find_book(len(players), goal)
+    if book is None:
+        return None
+    return book.action(state)
+
+def book_actions(states):
+    """ The best actions of a list of states of optimal.py from the opening books, None for the states
+    that are not in a book. The states of each game are looked up in its book in one go """
+    actions = [None] * len(states)
+    games = {}
+    for i, (bag, dices, players, myidx, goal, me) in enumerate(states):
+        if myidx == me:
+            games.setdefault((len(players), goal), []).append(i)
+    for (n_players, goal), indices in games.items():
+        book = find_book(n_players, goal)
+        if book is None:
+            continue
+        turns = [packedstate.encode(states[i]) & packedstate.TURN_MASK for i in indices]
+        bits = book.actions(turns, [states[i][2] for i in indices], [states[i][5] for i in indices])
+        for i, bit in zip(indices, bits.tolist()):
+            if bit >= 0:
+                actions[i] = 'roll' if bit else 'hold'
+    return actions
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser("Build the opening books of optimal.py", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('players', type=int, nargs='*', default=[2],
+                        help='Numbers of players. Without a solved game file, 3 players take hours and 4 do not finish.')
+    parser.add_argument('--goal', type=int, default=13, help='Goal to win the game.')
+    parser.add_argument('--bound', type=int, help='The highest score in the book, goal - 1 by default.')
+    args = parser.parse_args()
+    for n_players in args.players:
+        start = time.time()
+        book = build(n_players, args.goal, args.bound, verbose=True)
+        book.save(book_filename(n_players, args.goal))
+        print('Saved %s in %.1f s'%(book_filename(n_players, args.goal), time.time() - start))
@@ -1,25 +1,11 @@
 #!/usr/bin/env python3
 # -- coding: utf-8 --
 
-import itertools, time, copy
-import collections, random
-import os, pickle
-
-def memo(f):
-    """Decorator that caches the return value for each call to f(args).
-    Then when called again with same args, we can just look it up."""
-    cache = {}
-    def _f(*args):
-        try:
-            return cache[args]
-        except KeyError:
-            cache[args] = result = f(*args)
-            return result
-        except TypeError:
-            # some element of args refuses to be a dict key
-            return f(*args)
-    _f.cache = cache
-    return _f
+import time, collections
+import os, pickle, threading
+import solver, statetable, journal, packedstate, openingbook
+from memocache import memo
+
 
 def strategy(state):
     """ Yudong's strategy """
@@ -54,7 +40,25 @@ def strategy(state):
     Your strategy will return either 'hold' or 'roll' based the state.
     Please write code in Python3.
     """
-
+    state = simple_state(state)
+    if isinstance(state, str):
+        return state
+    return decide(state)
+
+def strategy_batch(states):
+    """ The actions of a list of states of the game, the same as [strategy(state) for state in states].
+    The states are simplified first, the early game ones are looked up in the opening book all together,
+    then each different one left is decided once """
+    simple = [simple_state(state) for state in states]
+    unique = list(dict.fromkeys(state for state in simple if not isinstance(state, str)))
+    actions = dict(zip(unique, openingbook.book_actions(unique)))
+    for state, action in actions.items():
+        if action is None:
+            actions[state] = decide(state)
+    return [state if isinstance(state, str) else actions[state] for state in simple]
+
+def simple_state(state):
+    """ The state of the game simplified into a tuple, or the action if it is obvious """
     # Read information from state
     bag = state['bag']
     table = state['table']
@@ -80,209 +84,229 @@ def strategy(state):
     # myidx : the index of the current player
     # me : index of 'me'
 
-    bag = tuple(collections.Counter(bag)[color] for color in ['Green', 'Yellow', 'Red'])
-    dice_new = []
-    for color in ['Green', 'Yellow', 'Red']:
-        d_c = [d for d in dices if d[0] == color]
-        n_faces = []
-        for face in ['brain', 'runner', 'shotgun']:
-            d_f = [d for d in d_c if d[1] == face]
-            n_faces.append(len(d_f))
-        dice_new.append(tuple(n_faces))
-    dices = tuple(dice_new)
+    # the bag and the table of the game count their dices in the same way
+    counts = getattr(bag, 'counts', None)
+    bag = tuple(counts) if counts is not None else tuple(collections.Counter(bag)[color] for color in ['Green', 'Yellow', 'Red'])
+    dices = getattr(table, 'counts', None)
+    if dices is None:
+        dice_new = []
+        for color in ['Green', 'Yellow', 'Red']:
+            d_c = [d for d in table.dices if d[0] == color]
+            n_faces = []
+            for face in ['brain', 'runner', 'shotgun']:
+                d_f = [d for d in d_c if d[1] == face]
+                n_faces.append(len(d_f))
+            dice_new.append(tuple(n_faces))
+        dices = tuple(dice_new)
     myidx = players.index(playing)
     me = myidx
     players = tuple(p[1] for p in players)
 
-    state = (bag, dices, players, myidx, goal, me)
-
+    return (bag, dices, players, myidx, goal, me)
+
+def decide(state):
+    """ The action of a simplified state """
+    # the early game is answered by the opening book, without loading the cache
+    action = openingbook.book_action(state)
+    if action is not None:
+        return action
+
+    if not load_cache.loaded:
+        load_cache()
+
+    # use the exact solution if this game has been solved
+    action = solver.solved_action(state)
+    if action is not None:
+        return action
+    # with a time budget, take the best action found in time
+    if strategy.deadline_ms is not None:
+        return anytime_action(state, strategy.deadline_ms)[0]
     return best_action(state)
 
-# For the rest of the code, state is now simplified
+# the time budget of a decision in milliseconds, None to always search to U_dice.max_level
+strategy.deadline_ms = float(os.environ['ZOMBIE_DEADLINE_MS']) if os.environ.get('ZOMBIE_DEADLINE_MS') else None
+
+# For the rest of the code, state is now simplified, and packed into an int by packedstate for searching
 
 @memo
 def best_action(state):
     "Return the optimal action for a state"
-    def EU(action): return Q_dice(state, action, level=0)
-    return max(zombie_actions(state), key=EU)
+    p = packedstate.encode(state)
+    def EU(action): return Q_dice(p, action, level=0)
+    return max(zombie_actions(p), key=EU)
+
+class Timeout(Exception):
+    """ The deadline of an anytime search has passed """
+
+def anytime_action(state, deadline_ms):
+    """ The best action for a state found within deadline_ms milliseconds, and its quality.
+    The search is deepened one level at a time up to U_dice.max_level, and the action of the deepest search
+    that finished is taken. The one level search always finishes, whatever the deadline.
+    The values of the shallower searches are kept in a low quality cache of their own, so they are not
+    mistaken for the values of the full search later. """
+    deadline = time.time() + deadline_ms / 1000.
+    p = packedstate.encode(state)
+    max_level, cachelow = U_dice.max_level, U_dice.cachelow
+    best = None
+    try:
+        for depth in range(max_level + 1):
+            U_dice.max_level = depth
+            U_dice.cachelow = cachelow if depth == max_level else {}
+            values = {action: Q_dice(p, action, level=0) for action in zombie_actions(p)}
+            action = max(values, key=values.get)
+            best = (action, values[action][1])
+            U_dice.deadline = deadline
+            if time.time() > deadline:
+                break
+    except Timeout:
+        pass
+    finally:
+        U_dice.max_level, U_dice.cachelow = max_level, cachelow
+        U_dice.deadline = None
+    return best
 
-def Q_dice(state, action, level=0):
-    "The expected value of U of choosing action in state."
+def Q_dice(p, action, level=0):
+    "The expected value of U of choosing action in the packed state p."
     if action == 'hold':
-        result, result_qual = U_dice(hold(state), level=level)
-    if action == 'roll':
-        # going over all possible draws from bag and all possible rolled faces
-        bag, dices, players, myidx, goal, me = state
-        runners_color = tuple(d[1] for d in dices) # (2,0,0) means 2 green runners
-        possible_colors_counter = possible_colors(bag, runners_color)
-        result = 0.
-        result_qual = 0.
-        # enumerate all possible results from rolling
-        for colors, n_c, draw_colors in possible_colors_counter:
-            q_color = 0.
-            qual_color = 0.
-            dices_counter = dices_with_color(colors)
-            counted_dices = 0
-            for rolled_dices, n_d in dices_counter:
-                new_runners = tuple(d[1] for d in rolled_dices)
-                n_new_runners = sum(new_runners)
-                if n_new_runners != 3: # skip the 3 runners
-                    dices1 = updated_dices(dices, rolled_dices)
-                    bag1 = updated_bag(bag, draw_colors, new_runners)
-                    new_state = (bag1, dices1, players, myidx, goal, me) # update the bag and dices before passing to roll
-                    rolled_state = roll(new_state)
-                    u, qual = U_dice(roll(new_state), level=level)
-                    q_color += u * n_d
-                    qual_color += qual * n_d # accumulate quality over dices
-                    counted_dices += n_d
-            result += q_color / counted_dices * n_c  # there are 6x6x6 possibilities for 3 faces
-            result_qual += qual_color / counted_dices * n_c # accumulate quality over color
-        f_possible_colors = 1. / sum(cc[1] for cc in possible_colors_counter) # factor for all possible_colors
-        result *= f_possible_colors
-        result_qual *= f_possible_colors
+        return U_dice(packedstate.hold(p), level=level)
+    # going over all possible draws from bag and all possible rolled faces
+    result = 0.
+    result_qual = 0.
+    for delta, prob in packedstate.roll_outcomes(p):
+        rolled = p + delta
+        # if got 3 or more shotguns, lost all brains and end turn
+        if packedstate.shotguns(rolled) > 2:
+            rolled = packedstate.bust(rolled)
+        u, qual = U_dice(rolled, level=level)
+        result += u * prob
+        result_qual += qual * prob # accumulate quality over rolls
     return result, result_qual
 
-@memo
-def updated_dices(dices, rolled_dices):
-    result = [list(d_c) for d_c in rolled_dices]
-    for i in range(3):
-        for j in (0,2): # skip the runners
-            result[i][j] += dices[i][j]
-    return tuple(tuple(d_c) for d_c in result)
-
-@memo
-def updated_bag(bag, draw_colors, new_runners):
-    new_bag = tuple(bag[i] - draw_colors[i] for i in range(3))
-    if sum(new_bag) + sum(new_runners) < 3: # if bag is empty
-        return (6-new_runners[0], 4-new_runners[1], 3-new_runners[2])
-    else:
-        return new_bag
-
-@memo
-def possible_colors(bag, runners_color):
-    """ Given a bag and runner dices, return a counter of all possible colors:
-    possible_colors((6, 4, 3), (0, 2, 0)) -->
-    [(('G', 'Y', 'Y'), 6, (1, 0, 0)),
-     (('Y', 'Y', 'Y'), 4, (0, 1, 0)),
-     (('Y', 'Y', 'R'), 3, (0, 0, 1))]"""
-    n_runners = sum(runners_color)
-    runner_c = tuple(['G']*runners_color[0] + ['Y']*runners_color[1] + ['R']*runners_color[2])
-    if n_runners == 3: # no need to draw
-        return [(runner_c, 1, (0,0,0))]
-    else:
-        n_draw = 3 - n_runners
-        # Expand the bag into "GGGYYYRR" and take combinations
-        bag_c = ['G']*bag[0] + ['Y']*bag[1] + ['R']*bag[2]
-        # Count the combinations appear
-        counter = collections.Counter( itertools.combinations(bag_c, n_draw) )
-        result = []
-        for c_draw, n_draw in counter.items():
-            draw_colors = (c_draw.count('G'), c_draw.count('Y'), c_draw.count('R'))
-            result.append((tuple(sorted(runner_c + c_draw, key=lambda c:'GYR'.index(c))), n_draw, draw_colors))
-        return sorted(result, key=lambda x:x[1], reverse=True)
-
+def U_dice(p, level=0):
+    """ The utility of a packed state, the probability of me to win the game,
+    Assuming all the opponents are playing with the optimal strategy"""
 
-@memo
-def dices_with_color(colors):
-    """ Given the colors of 3 dices, e.g. ('G', 'G', 'Y')
-    generate a collection of rolled dices, return a list of (dices, numbers) tuple:
-    dices_with_color(('G', 'G', 'Y')) =
-    [(array([[1, 1, 0], [0, 1, 0], [0, 0, 0]]), 24),
-     (array([[1, 1, 0], [0, 0, 1], [0, 0, 0]]), 24),
-     (array([[1, 1, 0], [1, 0, 0], [0, 0, 0]]), 24),
-     (array([[2, 0, 0], [0, 1, 0], [0, 0, 0]]), 18),
-     (array([[2, 0, 0], [0, 0, 1], [0, 0, 0]]), 18),
-     (array([[2, 0, 0], [1, 0, 0], [0, 0, 0]]), 18),
-     (array([[1, 0, 1], [0, 0, 1], [0, 0, 0]]), 12),
-     (array([[1, 0, 1], [1, 0, 0], [0, 0, 0]]), 12),
-     (array([[1, 0, 1], [0, 1, 0], [0, 0, 0]]), 12),
-     (array([[0, 2, 0], [0, 0, 1], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [1, 0, 0], [0, 0, 0]]), 8),
-     (array([[0, 2, 0], [0, 1, 0], [0, 0, 0]]), 8),
-     (array([[0, 2, 0], [1, 0, 0], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [0, 0, 1], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [0, 1, 0], [0, 0, 0]]), 8),
-     (array([[0, 0, 2], [0, 0, 1], [0, 0, 0]]), 2),
-     (array([[0, 0, 2], [0, 1, 0], [0, 0, 0]]), 2),
-     (array([[0, 0, 2], [1, 0, 0], [0, 0, 0]]), 2)]
-    """
-    if not hasattr(dices_with_color, 'diceinfo'):
-        dices_with_color.diceinfo = {'G' : (['brain']*3 + ['runner']*2 + ['shotgun']*1),
-                                     'Y' : (['brain']*2 + ['runner']*2 + ['shotgun']*2),
-                                     'R' : (['brain']*1 + ['runner']*2 + ['shotgun']*3)}
-    throw_result = [tuple(sorted(zip(colors,faces))) for faces in itertools.product(dices_with_color.diceinfo[colors[0]], dices_with_color.diceinfo[colors[1]], dices_with_color.diceinfo[colors[2]])]
-    dices_counter = collections.Counter(throw_result).items()
-    # transfer dice into 3*3 matrix
-    result = []
-    for dices_c_f, n_d in dices_counter:
-        dice_transferred = [[0 for _ in range(3)] for _ in range(3)]
-        for dice in dices_c_f:
-            dice_transferred['GYR'.index(dice[0])][['brain','runner','shotgun'].index(dice[1])] += 1
-        result.append(( tuple(tuple(i) for i in dice_transferred) ,n_d))
+    # many states share the value of one canonical state
+    key = canonical_packed(p)
+    result = settle(key, level)
+    if result is None:
+        result = search(key, level)
     return result
 
-def U_dice(state, level=0):
-    """ The utility of a state, the probability of me to win the game,
-    Assuming all the opponents are playing with the optimal strategy"""
-
-    # Build a quality controlled cache system for U_dice
-    if not hasattr(U_dice, 'cachehigh'):
-        U_dice.cachehigh = {}
-    if not hasattr(U_dice, 'cachelow'):
-        U_dice.cachelow = {}
+def settle(p, level):
+    """ The value of a canonical packed state if it is known without searching the states after it, or None """
     # try to find existing answer from the high quality cache first
     try:
-        return U_dice.cachehigh[state]
+        return U_dice.cachehigh[p]
     except:
         pass
     # then try to find from the low quality cache
     try:
-        return U_dice.cachelow[state]
+        return U_dice.cachelow[p]
     except:
         pass
 
     # get information
-    bag, dices, players, myidx, goal, me = state
+    players = packedstate.scores(p)
+    myidx, goal, me = packedstate.myidx(p), packedstate.goal(p), packedstate.me(p)
 
-    # If this is the end of the round, let me see if game is ending
+    # If this is the end of the round, the game is ending, the canonical state of any other round end is the next round
     if myidx == len(players):
         max_score = max(players)
-        # if anyone got more than goal, the game is ending
-        if max_score >= goal:
-            result = 1. if players[me] == max_score else 0.
-            quality = 1.
-            # no need to proceed to next Q_dice here because game is ending at this point
-        else: # game is not ending, we need to go to next round
-            result, quality = U_dice((bag, dices, players, 0, goal, me), level=level)
-    # If this is a player
-    else:
-        scores = list(players)
-        pending = sum(d[0] for d in dices)
-        scores[myidx] += pending
-        myscore = scores[myidx]
-        max_other_score = max(scores[:myidx] + scores[myidx+1:])
-        # If this is the last player of the round, I know when I got enough points
-        if myidx == len(players)-1 and myscore >= goal and myscore > max_other_score:
-            result = 1. if myidx == me else 0.
-            quality = 1.
-        # If recursion level is high, return an estimation with quality 0
-        elif level > 7:
-            result, quality = estimate_u(scores, myidx, me, goal)
-        # If no one is winning right now, keep searching for winning conditions
-        else:
-            # go to the next recursive level of calculating winning rate
-            if myidx == me:
-                # if it's me playing, i'm maximizing the chance I win
-                result, quality = max(Q_dice(state, action, level=level+1) for action in zombie_actions(state))
-            else: # if it's not me playing, they will minimize the chance I win
-                result, quality = min(Q_dice(state, action, level=level+1) for action in zombie_actions(state))
-
-    if quality > 0.80:
-        U_dice.cachehigh[state] = (result, quality)
+        # no need to proceed to next Q_dice here because game is ending at this point
+        return (1. if players[me] == max_score else 0., 1.)
+    scores = list(players)
+    pending = packedstate.brains(p)
+    scores[myidx] += pending
+    myscore = scores[myidx]
+    max_other_score = max(scores[:myidx] + scores[myidx+1:])
+    # If this is the last player of the round, I know when I got enough points
+    if myidx == len(players)-1 and myscore >= goal and myscore > max_other_score:
+        result = (1. if myidx == me else 0., 1.)
+    # If recursion level is high, return an estimation with quality 0
+    elif level > U_dice.max_level:
+        result = estimate_u(tuple(scores), myidx, me, goal)
     else:
-        U_dice.cachelow[state] = (result, quality)
+        return None
+    store(p, result)
+    return result
 
-    return (result, quality)
+def store(p, result):
+    if result[1] > 0.80:
+        U_dice.cachehigh[p] = result
+        if U_dice.journal is not None:
+            U_dice.journal.record(packedstate.decode(p), result)
+    else:
+        U_dice.cachelow[p] = result
+
+def expand(p, level):
+    """ A frame of search() for a canonical packed state: [p, level, children, next child, results of the actions],
+    the children are (canonical state, action, probability) of every action """
+    actions = zombie_actions(p)
+    children = []
+    for a, action in enumerate(actions):
+        if action == 'hold':
+            children.append((canonical_packed(packedstate.hold(p)), a, 1.))
+            continue
+        # going over all possible draws from bag and all possible rolled faces
+        for delta, prob in packedstate.roll_outcomes(p):
+            rolled = p + delta
+            # if got 3 or more shotguns, lost all brains and end turn
+            if packedstate.shotguns(rolled) > 2:
+                rolled = packedstate.bust(rolled)
+            children.append((canonical_packed(rolled), a, prob))
+    return [p, level, children, 0, [[0., 0.] for _ in actions]]
+
+def search(p, level):
+    """ Search the states after a canonical packed state that is not settled, me is maximizing the chance I win
+    and the others are minimizing it. The states waiting for the values of their children are kept on a stack,
+    in the same order as a recursion would visit them, so the search can go deep without any recursion.
+    A state can come back to itself when all the players lose their brains, then it is searched again one level
+    deeper, until U_dice.max_level stops it. """
+    stack = [expand(p, level)]
+    while True:
+        frame = stack[-1]
+        p, level, children, i, results = frame
+        # accumulate the children that are known, until one has to be searched
+        while i < len(children):
+            key, a, prob = children[i]
+            value = settle(key, level + 1)
+            if value is None:
+                break
+            u, qual = value
+            results[a][0] += u * prob
+            results[a][1] += qual * prob # accumulate quality over rolls
+            i += 1
+        frame[3] = i
+        if i < len(children):
+            if U_dice.deadline is not None and time.time() > U_dice.deadline:
+                raise Timeout()
+            stack.append(expand(key, level + 1))
+            continue
+        # all the children are known, if it's me playing, i'm maximizing the chance I win
+        if packedstate.myidx(p) == packedstate.me(p):
+            result = max(tuple(r) for r in results)
+        else: # if it's not me playing, they will minimize the chance I win
+            result = min(tuple(r) for r in results)
+        store(p, result)
+        stack.pop()
+        if not stack:
+            return result
+        # give the value to the state waiting for it
+        parent = stack[-1]
+        key, a, prob = parent[2][parent[3]]
+        parent[4][a][0] += result[0] * prob
+        parent[4][a][1] += result[1] * prob
+        parent[3] += 1
+
+# the high quality values, kept and shared, and the estimated ones of this process, see store()
+U_dice.cachehigh = {}
+U_dice.cachelow = {}
+U_dice.journal = None
+# the deepest level that is searched, the states below it are estimated
+U_dice.max_level = 7
+# the time when an anytime search gives up, see anytime_action()
+U_dice.deadline = None
 
 @memo
 def estimate_u(scores, myidx, me, goal):
@@ -320,59 +344,223 @@ def estimate_u(scores, myidx, me, goal):
     quality = 0.
     return result, quality
 
-def zombie_actions(state):
-    bag, dices, players, myidx, goal, me = state
+def zombie_actions(p):
     # cut off on goal + 10 brains
-    pending = sum(d[0] for d in dices)
+    pending = packedstate.brains(p)
     if pending == 0:
         return ['roll']
     # if we already got a very high score, do not cotinue to roll
-    if players[myidx] + pending > goal + 5:
+    if packedstate.score(p, packedstate.myidx(p)) + pending > packedstate.goal(p) + 5:
         return ['hold']
     else:
         return ['hold', 'roll']
 
 @memo
-def hold(state):
-    bag, dices, players, myidx, goal, me = state
-    # get my point
-    players = list(players)
-    players[myidx] += sum(d[0] for d in dices)
-    bag = (6, 4, 3)
-    dices = ((0, 0, 0), (0, 0, 0), (0, 0, 0))
-    #myidx = (myidx+1)%len(players)
-    myidx += 1
-    return (bag, dices, tuple(players), myidx, goal, me)
+def canonical_packed(p):
+    """ The packed state under which the value of a packed state is cached.
+    Many states have the same value:
+    - only the total brains and shotguns on the table matter, packedstate only keeps them
+    - a player with more than goal + 5 brains can only hold, it is the same as the state after holding
+    - at the end of a round that does not end the game, it is the start of the next round
+    - once the game ends in this round, the other players that already played can only lose to the highest
+      of them, the highest score is put on the first of them and the others get 0
+    The states of different me are not merged: a tie is a win for all the tied players, so the chance of
+    one player to win is not 1 - the chance of the other.
+    """
+    players = packedstate.scores(p)
+    myidx, goal, me = packedstate.myidx(p), packedstate.goal(p), packedstate.me(p)
+    if myidx == len(players):
+        if max(players) >= goal:
+            # the game is ending, the value is known and never cached
+            return p
+        return canonical_packed(packedstate.next_round(p))
+    pending = packedstate.brains(p)
+    if pending > 0 and players[myidx] + pending > goal + 5:
+        return canonical_packed(packedstate.hold(p))
+    done = [k for k in range(myidx) if k != me]
+    if done and max(players[:myidx]) >= goal:
+        players = list(players)
+        highest = max(players[k] for k in done)
+        for k in done:
+            players[k] = 0
+        players[done[0]] = highest
+        p = packedstate.with_scores(p, players)
+    return p
+
+def canonical(state):
+    """ The canonical state of a state of optimal.py, see canonical_packed() """
+    return packedstate.decode(canonical_packed(packedstate.encode(state)))
+
+def packed_cache(cache):
+    """ A cache of canonical packed states, of the higher quality when several states are the same """
+    result = {}
+    for state, (value, quality) in cache.items():
+        key = canonical_packed(packedstate.encode(state) if isinstance(state, tuple) else state)
+        if packedstate.myidx(key) == packedstate.n_players(key):
+            continue
+        if key not in result or result[key][1] < quality:
+            result[key] = (value, quality)
+    return result
 
-@memo
-def roll(state):
-    # most of the work are already done in Q_dice
-    # we only need to check if we got 3 or more shotguns here
-    bag, dices, players, myidx, goal, me = state
-    n_shotguns = sum(d[2] for d in dices)
-    # if got 3 or more shotguns, lost all brains and end turn
-    if n_shotguns > 2:
-        bag = (6, 4, 3)
-        dices = ((0, 0, 0), (0, 0, 0), (0, 0, 0))
-        #myidx = (myidx+1)%len(players)
-        myidx += 1
-        state = (bag, dices, players, myidx, goal, me)
-    return state
-
-
-# load the cachehigh
-if os.path.exists('cachehigh'):
-    U_dice.cachehigh = pickle.load( open('cachehigh',"rb") )
-    n_exist = len(U_dice.cachehigh)
-    print('Successfully loaded %d high quality cache data'%n_exist)
-elif os.path.exists('cachehigh.gz'):
-    import gzip
-    U_dice.cachehigh = pickle.load( gzip.open('cachehigh.gz',"rb") )
-    n_exist = len(U_dice.cachehigh)
-    print('Successfully loaded %d conpressed high quality cache data'%n_exist)
-else:
-    n_exist = 0
-    print("cachehigh is not found, I will be very stupid!")
+def canonical_cache(cache):
+    """ A cache with only canonical states, of the higher quality when several states are the same """
+    return {packedstate.decode(k): v for (k, v) in packed_cache(cache).items()}
+
+
+def read_cache(filename):
+    """ Read a cachehigh file, a state table is only mapped into memory,
+    a pickled cache is turned into canonical packed states """
+    if filename.endswith('.zdt'):
+        return statetable.StateTable.open(filename)
+    elif filename.endswith('.gz'):
+        import gzip
+        return packed_cache(pickle.load( gzip.open(filename,"rb") ))
+    else:
+        return packed_cache(pickle.load( open(filename,"rb") ))
+
+def state_cache(cache):
+    """ A cache of packed states with the states of optimal.py, as they are kept in the files """
+    return {packedstate.decode(k): v for (k,v) in cache.items()}
+
+def load_cache(n_players=None, goal=None, min_scores=None):
+    """ Load the cachehigh into U_dice, only the first time it is called.
+    For a partial load, only the states of games with n_players and goal are kept, and with min_scores,
+    only the states where every player has at least that score, as the scores never go down. """
+    global n_exist
+    with load_cache.lock:
+        if load_cache.loaded:
+            return
+        def keep(players, state_goal):
+            return (n_players is None or len(players) == n_players) and (goal is None or state_goal == goal) and \
+                   (min_scores is None or all(s >= m for s, m in zip(players, min_scores)))
+        partial = not (n_players is None and goal is None and min_scores is None)
+        for filename in ['cachehigh.zdt', 'cachehigh', 'cachehigh.gz']:
+            if os.path.exists(filename):
+                cache = read_cache(filename)
+                if partial and isinstance(cache, statetable.StateTable):
+                    cache = cache.subset(lambda players, myidx, me: keep(players, cache.goal))
+                elif partial:
+                    cache = {k:v for (k,v) in cache.items() if keep(packedstate.scores(k), packedstate.goal(k))}
+                print('Successfully loaded %d high quality cache data from %s'%(len(cache), filename))
+                break
+        else:
+            filename = None
+            cache = {}
+            print("cachehigh is not found, I will be very stupid!")
+        # the states of the runs that were not compacted into the cachehigh yet, or that crashed
+        journalname = journal.journal_filename(filename or 'cachehigh')
+        recovered = {}
+        if journal.replay(journalname, recovered):
+            if partial:
+                recovered = {k:v for (k,v) in recovered.items() if keep(k[2], k[4])}
+            for (k,v) in recovered.items():
+                cache[packedstate.encode(k)] = v
+            print('Recovered %d states from %s'%(len(recovered), journalname))
+        # keep the states computed before loading
+        for (k,v) in getattr(U_dice, 'cachehigh', {}).items():
+            cache[k] = v
+        U_dice.cachehigh = cache
+        U_dice.journal = journal.Journal(journalname)
+        n_exist = len(cache)
+        load_cache.filename = filename
+        load_cache.partial = partial
+        load_cache.loaded = True
+
+load_cache.lock = threading.Lock()
+load_cache.loaded = False
+load_cache.filename = None
+load_cache.partial = False
+n_exist = 0
+
+def preload(n_players=None, goal=None, min_scores=None):
+    """ Start loading the cachehigh in a background thread, strategy() waits for it to finish """
+    thread = threading.Thread(target=load_cache, args=(n_players, goal, min_scores))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def save_cache(filename=None):
+    """ Save U_dice.cachehigh into the file it was loaded from, a partial cache is merged into the full one """
+    filename = filename or load_cache.filename or 'cachehigh'
+    cache = U_dice.cachehigh
+    if load_cache.partial and os.path.exists(filename):
+        new = cache.overflow if isinstance(cache, statetable.StateTable) else cache
+        cache = read_cache(filename)
+        for (k,v) in new.items():
+            cache[k] = v
+    if isinstance(cache, statetable.StateTable):
+        cache.save(filename)
+    elif filename.endswith('.gz'):
+        import gzip
+        pickle.dump( state_cache(cache), gzip.open(filename,"wb") )
+    else:
+        pickle.dump( state_cache(cache), open(filename,"wb") )
+    # the journal is in the cachehigh now
+    if U_dice.journal is not None and U_dice.journal.filename == journal.journal_filename(filename):
+        U_dice.journal.close()
+        if os.path.exists(U_dice.journal.filename):
+            os.remove(U_dice.journal.filename)
+        U_dice.journal = journal.Journal(U_dice.journal.filename)
+
+def share():
+    """ Publish the cachehigh once for the worker processes of a tournament, returns the name of a state table
+    file that every worker maps into memory. A pickled cache is converted into a temporary state table, in shared
+    memory if there is one; only the states of its most common game go there. """
+    load_cache()
+    cache = U_dice.cachehigh
+    if isinstance(cache, statetable.StateTable) and not load_cache.partial and len(cache.overflow) == 0:
+        return {'filename': load_cache.filename, 'temporary': False}
+    import tempfile
+    fd, filename = tempfile.mkstemp(suffix='.zdt', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.close(fd)
+    if not isinstance(cache, statetable.StateTable):
+        cache = statetable.from_dict(state_cache(cache)) if len(cache) > 0 else statetable.StateTable()
+    cache.save(filename)
+    return {'filename': filename, 'temporary': True}
+
+def attach(handle):
+    """ Use the cachehigh published by share() in a worker process, without copying it """
+    global n_exist
+    with load_cache.lock:
+        U_dice.cachehigh = statetable.StateTable.open(handle['filename'])
+        # the states of a worker go back through flush() and merge(), not the journal of the parent
+        U_dice.journal = None
+        n_exist = len(U_dice.cachehigh)
+        load_cache.filename = None
+        load_cache.loaded = True
+    attach.handle = handle
+
+def flush():
+    """ Write the states computed in this worker next to the shared cachehigh, for merge() """
+    handle = getattr(attach, 'handle', None)
+    if handle is None or len(U_dice.cachehigh.overflow) == 0:
+        return
+    filename = worker_filename(handle, os.getpid())
+    pickle.dump( U_dice.cachehigh.overflow, open(filename + '.tmp',"wb") )
+    os.replace(filename + '.tmp', filename)
+
+def worker_filename(handle, pid):
+    """ The file of the states of a worker, not to be mistaken for the journal of the cachehigh """
+    return '%s.worker.%s'%(handle['filename'], pid)
+
+def merge(handle):
+    """ Merge the states computed by all the workers into the cachehigh of this process """
+    import glob
+    n_new = 0
+    for filename in glob.glob(worker_filename(handle, '*')):
+        if not filename.rsplit('.', 1)[1].isdigit():
+            # a file left half written by a worker
+            continue
+        for (k,v) in pickle.load( open(filename,"rb") ).items():
+            U_dice.cachehigh[packedstate.encode(k)] = v
+            if U_dice.journal is not None:
+                U_dice.journal.record(k, v)
+            n_new += 1
+        os.remove(filename)
+    if handle['temporary']:
+        os.remove(handle['filename'])
+    if n_new:
+        print('Merged %d states computed by the workers'%n_new)
 
 # training
 if __name__ == '__main__':
@@ -382,13 +570,15 @@ if __name__ == '__main__':
 
     starting_score = (int(sys.argv[1]), int(sys.argv[2]))
     starting_player = 0
+    # the states below the starting score can not be reached
+    load_cache(len(starting_score), goal, starting_score)
 
     state = ((6, 4, 3), ((0, 0, 0), (0, 0, 0), (0, 0, 0)), starting_score, starting_player, goal, me)
     print('Starting computing from state', state)
     level = 0
     # compute rolling win rate
-    print('hold', Q_dice(state, 'hold', level=level))
-    print('roll', Q_dice(state, 'roll', level=level))
+    print('hold', Q_dice(packedstate.encode(state), 'hold', level=level))
+    print('roll', Q_dice(packedstate.encode(state), 'roll', level=level))
     number_lowcache = len(U_dice.cachelow)
     print('%d is left in U_dice.cachelow'%(number_lowcache))
 
@@ -399,24 +589,20 @@ if __name__ == '__main__':
         U_dice.cachelow = {}
         v1 = U_dice(k)
         if v1[1] > target_q:
-            print(k, v, v1)
-    if len(U_dice.cachehigh) > n_exist:
-        # save the highcache to pickled file
-        pickle.dump( U_dice.cachehigh, open(cachefilename,"wb") )
-        print('Successfully updated U_dice.cachehigh data')
+            print(packedstate.decode(k), v, v1)
+    # the new states were checkpointed into the journal while computing
+    U_dice.journal.close()
+    print('%d new states are in %s, run journal.py to merge them into the cachehigh'%(U_dice.journal.n_written, U_dice.journal.filename))
 
 def finish():
-    try:
-        if len(U_dice.cachelow) > 0:
-            print("%d states were left in U_dice.cachelow"%len(U_dice.cachelow))
-            for (k,v) in U_dice.cachelow.items():
-                U_dice.cachehigh[k] = v
-        if len(U_dice.cachehigh) > n_exist:
-            # save the highcache to pickled file
-            if os.path.exists('cachehigh'):
-                pickle.dump( U_dice.cachehigh, open("cachehigh","wb") )
-            elif os.path.exists('cachehigh.gz'):
-                pickle.dump( U_dice.cachehigh, gzip.open("cachehigh.gz","wb") )
-            print('Successfully updated U_dice.cachehigh data with %d states'%len(U_dice.cachehigh))
-    except:
-        pass
+    if len(U_dice.cachelow) > 0:
+        print("%d states were left in U_dice.cachelow"%len(U_dice.cachelow))
+        for (k,v) in U_dice.cachelow.items():
+            U_dice.cachehigh[k] = v
+            if U_dice.journal is not None:
+                U_dice.journal.record(packedstate.decode(k), v)
+    # the states merged from the workers and the ones above are only safe once the journal is closed
+    if U_dice.journal is not None:
+        U_dice.journal.close()
+        if U_dice.journal.n_written:
+            print('Successfully added %d states to %s'%(U_dice.journal.n_written, U_dice.journal.filename))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Packed Game States    =
+#==========================
+
+from turndist import FULL_BAG
+from memocache import memo
+import rolltable
+
+# A state of optimal.py (bag, dices, players, myidx, goal, me) packed into one int, so that hashing it and
+# keeping it in a cache is cheap. Only the total brains and shotguns on the table are kept, as in
+# optimal.canonical(), the runners are kept for each color. The fields, from the lowest bits:
+#
+#   shotguns   3 bits      brains     6 bits
+#   runners    2 bits for each of green, yellow, red
+#   bag        3 bits green, 3 bits yellow, 2 bits red
+#   myidx      4 bits      me         4 bits
+#   goal       7 bits      n_players  4 bits
+#   scores     7 bits for each player
+#
+# The bag and the runners together are the key of a roll, the lowest 23 bits are the whole turn.
+# The goal can be up to 55, so that no score goes over 127.
+
+SHOTGUNS, BRAINS = 0, 3
+RUNNERS = (9, 11, 13)
+BAG = (15, 18, 21)
+MYIDX, ME, GOAL, N_PLAYERS, SCORES = 23, 27, 31, 38, 42
+SCORE_BITS = 7
+
+KEY_MASK = ((1 << MYIDX) - 1) ^ ((1 << RUNNERS[0]) - 1)
+TURN_MASK = (1 << MYIDX) - 1
+FRESH_TURN = (FULL_BAG[0] << BAG[0]) | (FULL_BAG[1] << BAG[1]) | (FULL_BAG[2] << BAG[2])
+
+def field(p, shift, bits):
+    return (p >> shift) & ((1 << bits) - 1)
+
+def shotguns(p):
+    return p & 7
+
+def brains(p):
+    return (p >> BRAINS) & 63
+
+def myidx(p):
+    return (p >> MYIDX) & 15
+
+def me(p):
+    return (p >> ME) & 15
+
+def goal(p):
+    return (p >> GOAL) & 127
+
+def n_players(p):
+    return (p >> N_PLAYERS) & 15
+
+def score(p, i):
+    return (p >> (SCORES + SCORE_BITS * i)) & 127
+
+def scores(p):
+    return tuple((p >> (SCORES + SCORE_BITS * i)) & 127 for i in range(n_players(p)))
+
+def encode_turn(bag, runners, n_brains, n_shotguns):
+    p = n_shotguns | (n_brains << BRAINS)
+    for c in range(3):
+        p |= (runners[c] << RUNNERS[c]) | (bag[c] << BAG[c])
+    return p
+
+def encode(state):
+    """ The packed int of a state of optimal.py """
+    bag, dices, players, i, g, m = state
+    p = encode_turn(bag, tuple(d[1] for d in dices), sum(d[0] for d in dices), sum(d[2] for d in dices))
+    p |= (i << MYIDX) | (m << ME) | (g << GOAL) | (len(players) << N_PLAYERS)
+    for k, s in enumerate(players):
+        p |= s << (SCORES + SCORE_BITS * k)
+    return p
+
+def decode(p):
+    """ The state of optimal.py of a packed int, with the brains and shotguns on the green and red dices """
+    bag = tuple(field(p, BAG[c], 2 if c == 2 else 3) for c in range(3))
+    runners = tuple(field(p, RUNNERS[c], 2) for c in range(3))
+    dices = ((brains(p), runners[0], 0), (0, runners[1], 0), (0, runners[2], shotguns(p)))
+    return (bag, dices, scores(p), myidx(p), goal(p), me(p))
+
+def with_scores(p, new_scores):
+    p &= (1 << SCORES) - 1
+    for k, s in enumerate(new_scores):
+        p |= s << (SCORES + SCORE_BITS * k)
+    return p
+
+def hold(p):
+    """ Bank the brains on the table, the next player starts with a full bag """
+    i = myidx(p)
+    return ((p & ~TURN_MASK) | FRESH_TURN) + (brains(p) << (SCORES + SCORE_BITS * i)) + (1 << MYIDX)
+
+def bust(p):
+    """ Lose the brains on the table, the next player starts with a full bag """
+    return ((p & ~TURN_MASK) | FRESH_TURN) + (1 << MYIDX)
+
+def next_round(p):
+    """ After the last player, the first player starts again """
+    return p & ~(15 << MYIDX)
+
+def roll_outcomes(p):
+    """ The outcomes of rolling in p, as a list of (delta, probability), the state after a roll is p + delta.
+    The bag is refilled inside the delta. A roll with 3 or more shotguns on the table is a bust.
+    As in optimal.py, a roll that shows 3 runners is not counted, the other rolls of the same draw are
+    scaled up instead. """
+    return key_outcomes(p & KEY_MASK)
+
+@memo
+def key_outcomes(key):
+    bag = tuple(field(key, BAG[c], 2 if c == 2 else 3) for c in range(3))
+    runners = tuple(field(key, RUNNERS[c], 2) for c in range(3))
+    deltas = {}
+    for draw, p_draw, outcomes in rolltable.draws(bag, runners):
+        outcomes = [(next_bag, faces, p) for next_bag, faces, p in outcomes if sum(f[1] for f in faces) != 3]
+        counted = sum(p for _, _, p in outcomes)
+        for next_bag, faces, p in outcomes:
+            new_runners = tuple(f[1] for f in faces)
+            delta = encode_turn(next_bag, new_runners, sum(f[0] for f in faces), sum(f[2] for f in faces)) - key
+            deltas[delta] = deltas.get(delta, 0.) + p_draw * p / counted
+    return list(deltas.items())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Strategy Registry     =
+#==========================
+
+import os, re, sys, types, importlib, importlib.util
+
+# The strategies are found once and every module is imported once, then all the players with the same strategy,
+# e.g. optimal1 and optimal2, and all the games of a process share the module, its strategy() and its caches.
+# A strategy is a module with a strategy(state) function, and optionally finish(), preload(n_players, goal),
+# share() / attach(handle) / merge(handle) and flush(). They are found, the first one winning:
+#   1. registered with register(name, module_or_path)
+#   2. entry points of the group 'zombiedice.strategies' of the installed packages, naming a module or a function
+#   3. the .py files in the folders of the ZOMBIE_STRATEGY_PATH environment variable (separated by os.pathsep),
+#      then in the current folder, then in the folder of the game
+# The names are not case sensitive, and a number at the end of a player name is ignored.
+
+ENTRY_POINT_GROUP = 'zombiedice.strategies'
+
+def strategy_name(name):
+    """ The strategy of a player name: the name without a number appended, in lower case """
+    if name and (not name[0].isdigit()) and (name[-1].isdigit()):
+        name = name[:-1]
+    return name.lower()
+
+class Registry(object):
+    """ The strategies by name, found by discover() and imported the first time they are asked for """
+
+    def __init__(self, folders=None):
+        if folders is None:
+            folders = [f for f in os.environ.get('ZOMBIE_STRATEGY_PATH', '').split(os.pathsep) if f]
+            folders += [os.getcwd(), os.path.dirname(os.path.abspath(__file__))]
+        self.folders = folders
+        # name -> where to get the module: ('module', module), ('entry_point', ep) or ('file', path)
+        self.registered = {}
+        self.sources = None
+        # name -> the imported module
+        self.modules = {}
+
+    def discover(self):
+        """ Find the strategies, without importing them. Done once, the first time a strategy is asked for """
+        sources = {}
+        for folder in reversed(self.folders):
+            try:
+                files = os.listdir(folder)
+            except OSError:
+                continue
+            for f in files:
+                filename, fileext = os.path.splitext(f)
+                if fileext == '.py':
+                    sources[filename.lower()] = ('file', os.path.join(folder, f))
+        for ep in entry_points():
+            sources[ep.name.lower()] = ('entry_point', ep)
+        self.sources = sources
+        return sources
+
+    def register(self, name, module):
+        """ Add a strategy: an imported module, a function, or the path of a .py file """
+        name = name.lower()
+        self.modules.pop(name, None)
+        if isinstance(module, str):
+            self.registered[name] = ('file', os.path.abspath(module))
+        else:
+            self.registered[name] = ('module', as_module(name, module))
+
+    def names(self):
+        if self.sources is None:
+            self.discover()
+        return sorted(set(self.sources) | set(self.registered))
+
+    def find(self, name):
+        """ The module of the strategy of a player name, or None if there is no such strategy """
+        name = strategy_name(name)
+        try:
+            return self.modules[name]
+        except KeyError:
+            pass
+        source = self.registered.get(name)
+        if source is None:
+            if self.sources is None:
+                self.discover()
+            source = self.sources.get(name)
+        if source is None:
+            return None
+        kind, where = source
+        if kind == 'module':
+            module = where
+        elif kind == 'entry_point':
+            module = as_module(name, where.load())
+        else:
+            module = import_file(where)
+        self.modules[name] = module
+        return module
+
+    def strategy(self, name):
+        """ The strategy() function of a player name, or None """
+        module = self.find(name)
+        return getattr(module, 'strategy', None)
+
+def entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    try:
+        return list(entry_points(group=ENTRY_POINT_GROUP))
+    except TypeError:
+        # before python 3.10
+        return list(entry_points().get(ENTRY_POINT_GROUP, []))
+
+def as_module(name, obj):
+    """ A module for a strategy given as a module or as a strategy(state) function """
+    if isinstance(obj, types.ModuleType):
+        return obj
+    module = types.ModuleType(name)
+    module.strategy = obj
+    return module
+
+def import_file(path):
+    """ Import a .py file by its module name, the module is the same as the one of a plain import,
+    e.g. optimal in train.py. If a module of another file already has that name, e.g. a strategy called
+    random.py, the file is imported under a name of its own instead.
+    Its folder is in sys.path while it is imported, for the modules it imports """
+    path = os.path.realpath(path)
+    folder, f = os.path.split(path)
+    module_name = os.path.splitext(f)[0]
+    module = sys.modules.get(module_name)
+    if module is not None:
+        if module_file(module) == path:
+            return module
+        module_name = '_strategy_' + re.sub(r'\W', '_', os.path.splitext(path)[0])
+        module = sys.modules.get(module_name)
+        if module is not None:
+            return module
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None:
+        return None
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    added = folder not in [os.path.realpath(p or '.') for p in sys.path]
+    if added:
+        sys.path.append(folder)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    finally:
+        if added:
+            sys.path.remove(folder)
+    return module
+
+def module_file(module):
+    filename = getattr(module, '__file__', None)
+    return os.path.realpath(filename) if filename else None
+
+# the registry of the game
+default = Registry()
+
+def find(name):
+    return default.find(name)
+
+def register(name, module):
+    default.register(name, module)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Roll Transition Table =
+#==========================
+
+import os, itertools
+from math import comb
+import numpy as np
+from turndist import FULL_BAG, color_faces
+from memocache import memo
+
+# Every outcome of a roll, for every key (bag, runners) that a turn can be in, computed once.
+# A roll picks up the runners, draws dices from the bag to have 3 in hand and rolls them.
+# An outcome is stored as:
+#   draw     : (n_green, n_yellow, n_red) dices drawn from the bag
+#   next_bag : the bag after the roll, refilled (except for the new runners) when it can not fill a hand anymore
+#   faces    : 3x3 counts of the rolled faces, [color][brain, runner, shotgun], in the same order as optimal.py
+#   p_draw   : the probability of the draw, drawing without replacement
+#   p_faces  : the probability of the faces given the draw
+# The outcomes of a key are contiguous, grouped by draw, from start[k] to start[k+1].
+# The table can be saved into rolltable.npz next to this file, roll_table() then only reads it.
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rolltable.npz')
+
+def all_keys():
+    """ Every (bag, runners) with enough dices to fill a hand, sorted """
+    keys = []
+    for bag in itertools.product(*[range(n+1) for n in FULL_BAG]):
+        for runners in itertools.product(*[range(min(n, 3)+1) for n in FULL_BAG]):
+            if sum(runners) <= 3 and sum(bag) + sum(runners) >= 3 and all(b + r <= n for b, r, n in zip(bag, runners, FULL_BAG)):
+                keys.append((bag, runners))
+    return keys
+
+class RollTable(object):
+    """ The outcomes of a roll from every key, as flat arrays """
+
+    def __init__(self):
+        self.keys = all_keys()
+        draws, next_bags, faces, p_draws, p_faces = [], [], [], [], []
+        start = [0]
+        for bag, runners in self.keys:
+            n_draw = 3 - sum(runners)
+            for draw in itertools.product(*[range(min(n, n_draw)+1) for n in bag]):
+                if sum(draw) != n_draw:
+                    continue
+                p_draw = comb(bag[0], draw[0]) * comb(bag[1], draw[1]) * comb(bag[2], draw[2]) / comb(sum(bag), n_draw)
+                hand = [runners[c] + draw[c] for c in range(3)]
+                for rolled in itertools.product(*[color_faces(c, hand[c]) for c in range(3)]):
+                    new_runners = tuple(f[1] for f, _ in rolled)
+                    next_bag = tuple(bag[c] - draw[c] for c in range(3))
+                    if sum(next_bag) + sum(new_runners) < 3:
+                        next_bag = tuple(FULL_BAG[c] - new_runners[c] for c in range(3))
+                    draws.append(draw)
+                    next_bags.append(next_bag)
+                    faces.append([f for f, _ in rolled])
+                    p_draws.append(p_draw)
+                    p_faces.append(np.prod([p for _, p in rolled]))
+            start.append(len(draws))
+        self.start = np.array(start, dtype=np.int64)
+        self.draw = np.array(draws, dtype=np.int8)
+        self.next_bag = np.array(next_bags, dtype=np.int8)
+        self.faces = np.array(faces, dtype=np.int8)
+        self.p_draw = np.array(p_draws)
+        self.p_faces = np.array(p_faces)
+        self.index_keys()
+
+    def index_keys(self):
+        self.key_index = -np.ones((7, 5, 4, 4, 4, 4), dtype=np.int32)
+        for i, (bag, runners) in enumerate(self.keys):
+            self.key_index[tuple(bag) + tuple(runners)] = i
+
+    def index(self, bag, runners):
+        i = self.key_index[tuple(bag) + tuple(runners)]
+        if i < 0:
+            raise KeyError((bag, runners))
+        return int(i)
+
+    def outcomes(self, bag, runners):
+        """ The slice of the outcomes of rolling from a key """
+        i = self.index(bag, runners)
+        return slice(self.start[i], self.start[i+1])
+
+    def save(self, filename=TABLE_FILE):
+        np.savez(filename, keys=np.array([bag + runners for bag, runners in self.keys], dtype=np.int8),
+                 start=self.start, draw=self.draw, next_bag=self.next_bag, faces=self.faces,
+                 p_draw=self.p_draw, p_faces=self.p_faces)
+
+    @classmethod
+    def load(cls, filename=TABLE_FILE):
+        table = cls.__new__(cls)
+        with np.load(filename) as data:
+            table.keys = [(tuple(int(c) for c in k[:3]), tuple(int(c) for c in k[3:])) for k in data['keys']]
+            for name in ('start', 'draw', 'next_bag', 'faces', 'p_draw', 'p_faces'):
+                setattr(table, name, data[name])
+        table.index_keys()
+        return table
+
+@memo
+def roll_table():
+    """ The RollTable, read from TABLE_FILE if it was saved, built otherwise """
+    if os.path.exists(TABLE_FILE):
+        return RollTable.load()
+    return RollTable()
+
+@memo
+def draws(bag, runners):
+    """ The outcomes of rolling from a key as python tuples, grouped by draw:
+    a list of (draw, p_draw, [(next_bag, faces, p_faces), ...]) """
+    table = roll_table()
+    s = table.outcomes(bag, runners)
+    result = []
+    for draw, next_bag, faces, p_draw, p_faces in zip(table.draw[s].tolist(), table.next_bag[s].tolist(),
+                                                      table.faces[s].tolist(), table.p_draw[s].tolist(), table.p_faces[s].tolist()):
+        draw = tuple(draw)
+        if not result or result[-1][0] != draw:
+            result.append((draw, p_draw, []))
+        result[-1][2].append((tuple(next_bag), tuple(tuple(f) for f in faces), p_faces))
+    return result
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    table = RollTable()
+    print('%d keys, %d outcomes, built in %.2f s'%(len(table.keys), len(table.p_draw), time.time() - start))
+    table.save()
+    start = time.time()
+    RollTable.load()
+    print('Saved into %s (%d bytes), loaded in %.4f s'%(TABLE_FILE, os.path.getsize(TABLE_FILE), time.time() - start))
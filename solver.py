@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Exact Game Solver     =
+#==========================
+
+import itertools, os, time
+import numpy as np
+from turndist import FULL_BAG, turn_graph
+import statetable
+from statetable import MAX_OVER
+
+# The game is the same as in optimal.py: the value of a state is the probability of me to win the game,
+# including a tie, me is maximizing it and all the other players are minimizing it.
+# A player has to roll without brains on the table, and has to hold with more than goal + 5 brains.
+# A score state is (scores, i), where i is the player starting a turn.
+
+class Solution(object):
+    """ The exact values of every state of a game, solved by value iteration.
+
+    roots  : {(scores, i): value} at the start of each turn
+    tables : {(scores, i): values} of every reachable turn state in that turn, in the order of statetable
+    """
+
+    def __init__(self, n_players=2, goal=13, me=0):
+        self.n_players = n_players
+        self.goal = goal
+        self.me = me
+        self.max_score = statetable.max_score(goal)
+        self.key_index, self.turn_index, self.n_upto = statetable.turn_positions(self.max_score)
+        self.turns = tuple(np.argwhere(self.turn_index >= 0)[np.argsort(self.turn_index[self.turn_index >= 0])].T)
+        self.roots = {}
+        self.tables = {}
+
+    @property
+    def graph(self):
+        return turn_graph()
+
+    def score_states(self):
+        """ All the score states grouped by scores, in the order they can be solved:
+        the scores only grow, so the states with higher total scores are solved first """
+        n, goal = self.n_players, self.goal
+        groups = []
+        for scores in itertools.product(range(self.max_score+1), repeat=n):
+            # the players after the last one that reached goal have not played in this round
+            reached = [k for k in range(n) if scores[k] >= goal]
+            first = reached[-1] + 1 if reached else 0
+            if first < n:
+                groups.append((scores, list(range(n-1, first-1, -1))))
+        groups.sort(key=lambda g: sum(g[0]), reverse=True)
+        return groups
+
+    def next_value(self, scores, i):
+        """ The value after player i-1 finished a turn with scores """
+        if i == self.n_players:
+            max_score = max(scores)
+            # if anyone got more than goal, the game is ending
+            if max_score >= self.goal:
+                return 1. if scores[self.me] == max_score else 0.
+            i = 0
+        return self.roots[scores, i]
+
+    def hold_values(self, scores, i):
+        """ The value of holding with 0 to max_score brains in the turn of player i """
+        values = []
+        for b in range(self.max_score+1):
+            new_scores = list(scores)
+            new_scores[i] = min(scores[i] + b, self.max_score)
+            values.append(self.next_value(tuple(new_scores), i+1))
+        return values
+
+    def solve_turn(self, scores, i):
+        """ Solve all the turn states of player i, given the values after the turn """
+        hold = self.hold_values(scores, i)
+        maximize = (i == self.me)
+        def choose(rows, b, s, hold, roll):
+            if b == 0:
+                return roll
+            return np.maximum(hold, roll) if maximize else np.minimum(hold, roll)
+        W = self.graph.backward(hold, hold[0], choose, self.goal + MAX_OVER - scores[i])
+        k, s, b = self.turns
+        size = self.n_upto[self.max_score - scores[i]]
+        self.tables[scores, i] = W[k[:size], s[:size], b[:size]].astype(np.float32)
+        self.roots[scores, i] = W[self.graph.index(FULL_BAG, (0, 0, 0)), 0, 0]
+
+    def solve(self, tol=1e-9, verbose=False, solved=None):
+        """ Solve every state of the game. solved(scores) is called once the turns of scores are final, e.g. to
+        take what is needed from their tables and drop them, as only the roots are needed to solve the others """
+        start = time.time()
+        for scores, players in self.score_states():
+            if max(scores) < self.goal:
+                # every player can lose all the brains and come back to the same state, iterate until converged
+                for i in players:
+                    self.roots[scores, i] = 0.5
+                while True:
+                    old = [self.roots[scores, i] for i in players]
+                    for i in players:
+                        self.solve_turn(scores, i)
+                    if max(abs(self.roots[scores, i] - v) for i, v in zip(players, old)) < tol:
+                        break
+            else:
+                for i in players:
+                    self.solve_turn(scores, i)
+            if solved is not None:
+                solved(scores)
+            if verbose:
+                print('scores %s solved, %d states, %.1f s'%(scores, len(self.roots), time.time() - start))
+        return self
+
+    def turn_state(self, state):
+        """ The (scores, i) and the position in tables of a state of optimal.py """
+        bag, dices, players, myidx, goal, me = state
+        runners = tuple(d[1] for d in dices)
+        brains = sum(d[0] for d in dices)
+        shotguns = sum(d[2] for d in dices)
+        k = self.key_index[tuple(bag) + runners]
+        return (tuple(players), myidx), k, shotguns, brains
+
+    def value(self, state):
+        """ The probability of me to win the game in a state of optimal.py """
+        score_state, k, s, b = self.turn_state(state)
+        if k < 0 or self.turn_index[k, s, b] < 0:
+            raise KeyError(state)
+        return float(self.tables[score_state][self.turn_index[k, s, b]])
+
+    def Q(self, state, action):
+        """ The value of choosing action in a state of optimal.py """
+        (scores, i), k, s, b = self.turn_state(state)
+        if action == 'hold':
+            new_scores = list(scores)
+            new_scores[i] += b
+            return self.next_value(tuple(new_scores), i+1)
+        g = self.graph
+        edges = g.edges(k)
+        safe = g.shotguns[edges] < 3 - s
+        values = self.tables[scores, i][self.turn_index[g.dst[edges][safe], s + g.shotguns[edges][safe], b + g.brains[edges][safe]]]
+        return g.p[edges][~safe].sum() * self.next_value(scores, i+1) + values.dot(g.p[edges][safe])
+
+    def action(self, state):
+        """ The best action of me in a state of optimal.py """
+        bag, dices, players, myidx, goal, me = state
+        pending = sum(d[0] for d in dices)
+        if pending == 0:
+            return 'roll'
+        if players[myidx] + pending > goal + MAX_OVER:
+            return 'hold'
+        return 'roll' if self.Q(state, 'roll') > self.Q(state, 'hold') else 'hold'
+
+    def blocks(self):
+        """ The solved turns as the blocks of a StateTable, all with quality 1 """
+        blocks = {}
+        for (scores, i), values in self.tables.items():
+            blocks[statetable.block_index(scores, i, self.me, self.max_score)] = (values, np.ones(len(values), dtype=np.float32))
+        return blocks
+
+    @classmethod
+    def load(cls, filename, me=0):
+        """ The solution for me from a state table file, the tables are read from its memory map """
+        table = statetable.StateTable.open(filename)
+        solution = cls.__new__(cls)
+        solution.n_players, solution.goal, solution.me = table.n_players, table.goal, me
+        solution.max_score = table.max_score
+        solution.key_index, solution.turn_index, solution.n_upto = table.key_index, table.turn_index, table.n_upto
+        solution.roots = {}
+        solution.tables = {}
+        for players, myidx, block_me, start, size in table.blocks():
+            if block_me == me and myidx < table.n_players:
+                solution.tables[players, myidx] = table.value[start:start+size]
+                # the start of a turn is the first turn state
+                solution.roots[players, myidx] = float(table.value[start])
+        return solution
+
+def save(filename, solutions):
+    """ Write the solutions of a game for all players into one state table file """
+    blocks = {}
+    for solution in solutions:
+        blocks.update(solution.blocks())
+    statetable.write(filename, solutions[0].n_players, solutions[0].goal, solutions[0].key_index, solutions[0].turn_index, blocks)
+
+def solution_filename(n_players, goal):
+    return 'solved_%d_%d.zdt'%(n_players, goal)
+
+def find_solution(n_players, goal, me):
+    """ The solved game from the current folder, or None if it has not been solved """
+    if not hasattr(find_solution, 'cache'):
+        find_solution.cache = {}
+    key = (n_players, goal, me)
+    if key not in find_solution.cache:
+        filename = solution_filename(n_players, goal)
+        find_solution.cache[key] = Solution.load(filename, me) if os.path.exists(filename) else None
+    return find_solution.cache[key]
+
+def solved_action(state):
+    """ The best action of a state of optimal.py from a solved game, or None if it has not been solved """
+    bag, dices, players, myidx, goal, me = state
+    solution = find_solution(len(players), goal, me)
+    if solution is None:
+        return None
+    return solution.action(state)
+
+if __name__ == '__main__':
+    import sys
+    n_players = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    goal = int(sys.argv[2]) if len(sys.argv) > 2 else 13
+    solutions = []
+    for me in range(n_players):
+        print('Solving the game of %d players to goal %d for player %d'%(n_players, goal, me))
+        solutions.append(Solution(n_players, goal, me).solve(verbose=True))
+        print('Win rate of player %d at the start: %.6f'%(me, solutions[-1].roots[(0,)*n_players, 0]))
+    save(solution_filename(n_players, goal), solutions)
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Strategy State Table  =
+#==========================
+
+import os, copy
+import numpy as np
+from turndist import FULL_BAG, turn_graph
+import packedstate
+
+# A state of optimal.py is (bag, dices, players, myidx, goal, me). For one number of players and goal it is
+# mapped to a dense integer index in two parts:
+#   block : (players, myidx, me) as a mixed radix number, each score from 0 to max_score
+#   turn  : the reachable (key, shotguns, brains) of turndist, ordered by brains so that a turn with at most
+#           max_score - players[myidx] brains is a prefix of them
+# Only the blocks that have some states are stored, one after the other, offsets gives where each one starts.
+# The brains and shotguns of each color do not change the value of a state, only their sum is kept.
+# A state can also be given packed into an int by packedstate, the overflow keeps the unpacked states.
+#
+# File format, all little endian:
+#   MAGIC, header int64[8] : version, n_players, goal, max_score, n_keys, n_entries, n_states, 0
+#   key_index  int32[7, 5, 4, 4, 4, 4]          : the key of (bag, runners), or -1
+#   turn_index int32[n_keys, 3, max_score+1]   : the turn position of (key, shotguns, brains), or -1
+#   offsets    int64[n_blocks]                  : the start of each block, or -1
+#   value      float32[n_entries]               : NaN for a state that is not known
+#   quality    float32[n_entries]
+
+MAGIC = b'ZDTABLE\0'
+VERSION = 1
+# a player has to hold with more than goal + MAX_OVER brains, so no score gets above goal + MAX_OVER + 3
+MAX_OVER = 5
+
+def max_score(goal):
+    return goal + MAX_OVER + 3
+
+def turn_positions(max_score):
+    """ The dense turn index for a max_score, returns (key_index, turn_index, n_upto),
+    n_upto[b] is the number of turn states with at most b brains, the start of a turn is the first one """
+    graph = turn_graph()
+    reachable = graph.reachable(max_score - 3)
+    b, s, k = np.nonzero(reachable.transpose(2, 1, 0))
+    order = np.lexsort((k, k != graph.index(FULL_BAG, (0, 0, 0)), s, b))
+    turn_index = -np.ones(reachable.shape, dtype=np.int32)
+    turn_index[k[order], s[order], b[order]] = np.arange(len(k))
+    n_upto = np.cumsum(reachable.sum(axis=(0, 1)))
+    return graph.key_index, turn_index, n_upto
+
+def block_index(players, myidx, me, max_score):
+    """ The dense index of (players, myidx, me) """
+    block = 0
+    for score in players:
+        block = block * (max_score+1) + score
+    return (block * (len(players)+1) + myidx) * len(players) + me
+
+class StateTable(object):
+    """ A table of (value, quality) of the states of optimal.py, used like the cachehigh dict.
+
+    The states stored in a file are read from a read-only memory map, new states are kept in the overflow
+    dict until the table is saved again. The states of other numbers of players or goals always go there.
+    """
+
+    def __init__(self, n_players=2, goal=13):
+        self.n_players = n_players
+        self.goal = goal
+        self.max_score = max_score(goal)
+        self.key_index, self.turn_index, self.n_upto = turn_positions(self.max_score)
+        self.n_blocks = (self.max_score+1)**n_players * (n_players+1) * n_players
+        self.offsets = -np.ones(self.n_blocks, dtype=np.int64)
+        self.value = np.zeros(0, dtype=np.float32)
+        self.quality = np.zeros(0, dtype=np.float32)
+        self.n_states = 0
+        self.overflow = {}
+        self.n_new = 0
+
+    @classmethod
+    def open(cls, filename):
+        """ Map a table file into memory, without reading it """
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise RuntimeError("%s is not a state table file"%filename)
+            header = np.fromfile(f, dtype='<i8', count=8)
+        version, n_players, goal, max_score, n_keys, n_entries, n_states, _ = [int(h) for h in header]
+        if version != VERSION:
+            raise RuntimeError("%s has version %d, expecting %d"%(filename, version, VERSION))
+        table = cls.__new__(cls)
+        table.n_players, table.goal, table.max_score = n_players, goal, max_score
+        table.n_blocks = (max_score+1)**n_players * (n_players+1) * n_players
+        offset = len(MAGIC) + header.nbytes
+        def section(dtype, shape):
+            nonlocal offset
+            array = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+            offset += array.nbytes
+            return array
+        table.key_index = section('<i4', (7, 5, 4, 4, 4, 4))
+        table.turn_index = section('<i4', (n_keys, 3, max_score+1))
+        table.offsets = section('<i8', (table.n_blocks,))
+        table.value = section('<f4', (n_entries,))
+        table.quality = section('<f4', (n_entries,))
+        table.n_upto = np.cumsum((table.turn_index >= 0).sum(axis=(0, 1)))
+        table.n_states = n_states
+        table.overflow = {}
+        table.n_new = 0
+        return table
+
+    def block(self, players, myidx, me):
+        return block_index(players, myidx, me, self.max_score)
+
+    def block_size(self, players, myidx):
+        """ The number of turn states in a block, at the end of a round only the start of the next turn is left """
+        if myidx == self.n_players:
+            return 1
+        return int(self.n_upto[self.max_score - players[myidx]])
+
+    def turn(self, bag, dices):
+        """ The turn position of a bag and dices, or -1 """
+        runners = tuple(d[1] for d in dices)
+        brains = sum(d[0] for d in dices)
+        shotguns = sum(d[2] for d in dices)
+        if shotguns > 2 or brains > self.max_score:
+            return -1
+        k = self.key_index[tuple(bag) + runners]
+        return -1 if k < 0 else int(self.turn_index[k, shotguns, brains])
+
+    def index(self, state):
+        """ The dense index of a state in value and quality, or -1 if it is not stored """
+        bag, dices, players, myidx, goal, me = state
+        if goal != self.goal or len(players) != self.n_players or max(players) > self.max_score:
+            return -1
+        start = self.offsets[self.block(players, myidx, me)]
+        if start < 0:
+            return -1
+        t = self.turn(bag, dices)
+        if t < 0 or t >= self.block_size(players, myidx):
+            return -1
+        return int(start) + t
+
+    def __getitem__(self, state):
+        if isinstance(state, int):
+            state = packedstate.decode(state)
+        try:
+            return self.overflow[state]
+        except KeyError:
+            pass
+        i = self.index(state)
+        if i < 0 or np.isnan(self.value[i]):
+            raise KeyError(state)
+        return (float(self.value[i]), float(self.quality[i]))
+
+    def __setitem__(self, state, result):
+        if isinstance(state, int):
+            state = packedstate.decode(state)
+        if state not in self.overflow and state not in self:
+            self.n_new += 1
+        self.overflow[state] = result
+
+    def __contains__(self, state):
+        try:
+            self[state]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return self.n_states + self.n_new
+
+    def blocks(self):
+        """ The stored blocks, as (players, myidx, me, start, size) """
+        n = self.n_players
+        for block in np.nonzero(self.offsets >= 0)[0]:
+            start = int(self.offsets[block])
+            block, me = divmod(int(block), n)
+            block, myidx = divmod(block, n+1)
+            players = []
+            for _ in range(n):
+                block, score = divmod(block, self.max_score+1)
+                players.insert(0, score)
+            players = tuple(players)
+            yield players, myidx, me, start, self.block_size(players, myidx)
+
+    def stored_items(self):
+        """ The states in the memory map, with the brains and shotguns of a turn put on the green and red dices """
+        turns = np.argwhere(self.turn_index >= 0)
+        turns = turns[np.argsort(self.turn_index[tuple(turns.T)])]
+        keys = np.argwhere(self.key_index >= 0)
+        keys = keys[np.argsort(self.key_index[tuple(keys.T)])]
+        for players, myidx, me, start, size in self.blocks():
+            for t in range(size):
+                if np.isnan(self.value[start+t]):
+                    continue
+                k, s, b = turns[t]
+                bag, runners = tuple(int(c) for c in keys[k][:3]), tuple(int(c) for c in keys[k][3:])
+                dices = ((int(b), runners[0], 0), (0, runners[1], 0), (0, runners[2], int(s)))
+                yield (bag, dices, players, myidx, self.goal, me), (float(self.value[start+t]), float(self.quality[start+t]))
+
+    def items(self):
+        seen = set()
+        for state, result in self.overflow.items():
+            seen.add(self.index(state))
+            yield state, result
+        for state, result in self.stored_items():
+            if self.index(state) not in seen:
+                yield state, result
+
+    def keys(self):
+        for state, _ in self.items():
+            yield state
+
+    def subset(self, keep):
+        """ A table in memory with only the blocks for which keep(players, myidx, me) is True,
+        the other blocks are not read from the file """
+        table = copy.copy(self)
+        blocks = {}
+        for players, myidx, me, start, size in self.blocks():
+            if keep(players, myidx, me):
+                blocks[self.block(players, myidx, me)] = (self.value[start:start+size], self.quality[start:start+size])
+        table.offsets, table.value, table.quality = pack(self.n_blocks, blocks)
+        table.n_states = int(np.count_nonzero(~np.isnan(table.value)))
+        table.overflow = {}
+        table.n_new = 0
+        return table
+
+    def save(self, filename):
+        """ Write the stored and the overflow states into a new file, the overflow states of other numbers of
+        players or goals can not be stored and are left out """
+        blocks = {}
+        for players, myidx, me, start, size in self.blocks():
+            blocks[self.block(players, myidx, me)] = (self.value[start:start+size], self.quality[start:start+size])
+        n_skipped = 0
+        for state, (result, quality) in self.overflow.items():
+            bag, dices, players, myidx, goal, me = state
+            t = self.turn(bag, dices) if goal == self.goal and len(players) == self.n_players and max(players) <= self.max_score else -1
+            if t < 0 or t >= self.block_size(players, myidx):
+                n_skipped += 1
+                continue
+            block = self.block(players, myidx, me)
+            if block not in blocks:
+                size = self.block_size(players, myidx)
+                blocks[block] = (np.full(size, np.nan, dtype=np.float32), np.zeros(size, dtype=np.float32))
+            elif not blocks[block][0].flags.writeable:
+                blocks[block] = (np.array(blocks[block][0]), np.array(blocks[block][1]))
+            # keep the better one if several states have the same index
+            values, qualities = blocks[block]
+            if np.isnan(values[t]) or quality >= qualities[t]:
+                values[t], qualities[t] = result, quality
+        write(filename, self.n_players, self.goal, self.key_index, self.turn_index, blocks)
+        if n_skipped:
+            print('%d states of other games are not saved in %s'%(n_skipped, filename))
+
+def pack(n_blocks, blocks):
+    """ Put blocks {block: (values, qualities)} one after the other, returns (offsets, value, quality) """
+    offsets = -np.ones(n_blocks, dtype=np.int64)
+    n_entries = 0
+    for block in sorted(blocks):
+        offsets[block] = n_entries
+        n_entries += len(blocks[block][0])
+    value = np.full(n_entries, np.nan, dtype=np.float32)
+    quality = np.zeros(n_entries, dtype=np.float32)
+    for block in blocks:
+        start, end = offsets[block], offsets[block] + len(blocks[block][0])
+        value[start:end], quality[start:end] = blocks[block]
+    return offsets, value, quality
+
+def write(filename, n_players, goal, key_index, turn_index, blocks):
+    """ Write a state table with blocks {block: (values, qualities)}, into a temporary file first so an
+    open table is not overwritten """
+    offsets, value, quality = pack((max_score(goal)+1)**n_players * (n_players+1) * n_players, blocks)
+    n_states = int(np.count_nonzero(~np.isnan(value)))
+    header = np.array([VERSION, n_players, goal, max_score(goal), turn_index.shape[0], len(value), n_states, 0], dtype='<i8')
+    tmpname = filename + '.tmp'
+    with open(tmpname, 'wb') as f:
+        f.write(MAGIC)
+        for array, dtype in ((header, '<i8'), (key_index, '<i4'), (turn_index, '<i4'), (offsets, '<i8'),
+                             (value, '<f4'), (quality, '<f4')):
+            f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    os.replace(tmpname, filename)
+
+def from_dict(cache, n_players=None, goal=None):
+    """ A StateTable with the states of a cachehigh dict, by default of its most common number of players and goal """
+    if n_players is None or goal is None:
+        games = {}
+        for bag, dices, players, myidx, g, me in cache:
+            games[len(players), g] = games.get((len(players), g), 0) + 1
+        n_players, goal = max(games, key=games.get)
+    table = StateTable(n_players, goal)
+    for state, result in cache.items():
+        table[state] = result
+    return table
+
+if __name__ == '__main__':
+    import sys, pickle, gzip, time
+    # convert a pickled cachehigh into a state table
+    source = sys.argv[1] if len(sys.argv) > 1 else 'cachehigh'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'cachehigh.zdt'
+    start = time.time()
+    cache = pickle.load(gzip.open(source, 'rb') if source.endswith('.gz') else open(source, 'rb'))
+    print('Loaded %d states from %s in %.2f s'%(len(cache), source, time.time() - start))
+    from_dict(cache).save(target)
+    start = time.time()
+    table = StateTable.open(target)
+    print('Saved %d states into %s (%d bytes), opened in %.4f s'%(len(table), target, os.path.getsize(target), time.time() - start))
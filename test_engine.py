@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Engine Tests          =
+#==========================
+
+import tournament
+from engine import Engine, play_batch
+
+def careful(state):
+    """ Roll until 3 brains, or until the goal """
+    n_brains = state['table'].n_brains
+    if state['playing'].score + n_brains >= state['goal']:
+        return 'hold'
+    return 'roll' if n_brains < 3 else 'hold'
+
+def recording_batch(sizes):
+    def careful_batch(states):
+        sizes.append(len(states))
+        return [careful(state) for state in states]
+    return careful_batch
+
+def test_play_batch_size():
+    sizes = []
+    engines = [Engine([('a', careful), ('b', careful)], rng=tournament.game_rng(1, i)) for i in range(200)]
+    results = list(play_batch(engines, {'a': recording_batch(sizes)}, size=4))
+    assert sorted(i for i, _ in results) == list(range(200))
+    assert max(sizes) <= 4
+
+def test_batch_records():
+    names = ['a', 'b']
+    strategies = {'a': careful, 'b': careful}
+    records = tournament.play_games(strategies, names, range(200), 200, seed=1)
+    sizes = []
+    batch_records = tournament.play_games(strategies, names, range(200), 200, seed=1,
+                                          batch_strategies={'a': recording_batch(sizes)}, batch=16)
+    assert batch_records == records
+    assert 1 < max(sizes) <= 16
+
+def test_bruce_batch():
+    import bruce
+    names = ['bruce', 'b']
+    records = tournament.play_games({'bruce': bruce.strategy, 'b': careful}, names, range(100), 100, seed=2)
+    batch_records = tournament.play_games({'bruce': bruce.strategy, 'b': careful}, names, range(100), 100, seed=2,
+                                          batch_strategies={'bruce': bruce.strategy_batch}, batch=16)
+    assert batch_records == records
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Game State Tests      =
+#==========================
+
+import copy, pickle, random
+from ZombieDice import Zombiedice
+
+def test_pickle_state():
+    random.seed(0)
+    game = Zombiedice(players=['yiwen', 'bruce'], fastmode=2)
+    game.playing = game.players[0]
+    game.table.add(game.roll())
+    state = game.state
+    assert len(state.table.dices) == 3
+    for restored in (pickle.loads(pickle.dumps(state)), copy.deepcopy(state)):
+        assert restored == state
+        assert restored.bag.counts == state.bag.counts
+        assert restored['playing'].score == 0
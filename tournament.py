@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Zombie Dice Tournament =
+#==========================
+
+import random, collections, multiprocessing
+import instrument, dicerng
+from engine import Engine, play_batch
+from ZombieDice import find_strategy
+
+Record = collections.namedtuple('Record', 'game, rounds, names, scores, winners')
+
+def game_rng(seed, i, backend='python'):
+    """ The random generator of game i in a tournament with master seed.
+    Every game has its own stream, so the results do not depend on how games are split over workers """
+    return dicerng.make_rng(seed, backend, i)
+
+def game_order(names, i, ngames, fixorder=False):
+    """ The playing order of game i, players are switched once after ngames // nplayers games """
+    if fixorder or i <= ngames // len(names):
+        return list(names)
+    return list(names[1:]) + list(names[:1])
+
+def load_modules(names):
+    modules = {}
+    for name in names:
+        p = find_strategy(name)
+        if p is None or not hasattr(p, 'strategy'):
+            raise RuntimeError("%s need a strategy function to enter the auto-play mode."%name)
+        modules[name] = p
+    return modules
+
+def load_strategies(names):
+    return {name: p.strategy for name, p in load_modules(names).items()}
+
+def load_batch_strategies(names):
+    """ The strategy_batch(states) functions of the players that have one """
+    return {name: p.strategy_batch for name, p in load_modules(names).items() if hasattr(p, 'strategy_batch')}
+
+def share_modules(names):
+    """ Let the strategy modules publish their data once for all workers, with share() returning a handle
+    that is given to attach(handle) in each worker and to merge(handle) at the end """
+    handles = {}
+    for p in set(load_modules(names).values()):
+        if hasattr(p, 'share'):
+            handles[p.__name__] = p.share()
+    return handles
+
+def play_games(strategies, names, games, ngames, goal=13, seed=0, fixorder=False, instruments=None, backend='python',
+               batch_strategies=None, batch=0):
+    """ Play the games with indices in games, return a list of Records.
+    With batch > 0 and batch_strategies, batch games are played at the same time by engine.play_batch() """
+    if batch > 0 and batch_strategies:
+        return play_games_batch(strategies, names, games, ngames, goal, seed, fixorder, instruments, backend,
+                                batch_strategies, batch)
+    records = []
+    engines = {}
+    for i in games:
+        order = tuple(game_order(names, i, ngames, fixorder))
+        if order not in engines:
+            engines[order] = Engine([(name, strategies[name]) for name in order], goal=goal, instruments=instruments)
+        engine = engines[order]
+        engine.rng = game_rng(seed, i, backend)
+        result = engine.play_game()
+        records.append(Record(i, result.rounds, order, result.scores, tuple(result.winners)))
+    return records
+
+def play_games_batch(strategies, names, games, ngames, goal, seed, fixorder, instruments, backend, batch_strategies, batch):
+    games = list(games)
+    orders = [tuple(game_order(names, i, ngames, fixorder)) for i in games]
+    engines = (Engine([(name, strategies[name]) for name in order], goal=goal, rng=game_rng(seed, i, backend),
+                      instruments=instruments) for i, order in zip(games, orders))
+    records = []
+    for k, result in play_batch(engines, batch_strategies, batch):
+        records.append(Record(games[k], result.rounds, orders[k], result.scores, tuple(result.winners)))
+    records.sort()
+    return records
+
+# strategies loaded once in each worker process
+_worker = {}
+
+def _init_worker(names, handles, profile=False):
+    _worker['modules'] = modules = load_modules(names)
+    _worker['aggregator'] = instrument.Aggregator() if profile else None
+    _worker['strategies'] = {name: p.strategy for name, p in modules.items()}
+    _worker['batch_strategies'] = {name: p.strategy_batch for name, p in modules.items() if hasattr(p, 'strategy_batch')}
+    for p in set(modules.values()):
+        if p.__name__ in handles:
+            p.attach(handles[p.__name__])
+
+def _play_chunk(args):
+    names, games, ngames, goal, seed, fixorder, backend, batch = args
+    aggregator = _worker['aggregator']
+    records = play_games(_worker['strategies'], names, games, ngames, goal, seed, fixorder,
+                         [aggregator] if aggregator is not None else None, backend, _worker['batch_strategies'], batch)
+    # hand over the data computed in this worker, merged by the main process at the end
+    for p in set(_worker['modules'].values()):
+        if hasattr(p, 'flush'):
+            p.flush()
+    if aggregator is None:
+        return records, None
+    # the counters of this chunk go back with its records
+    _worker['aggregator'] = instrument.Aggregator()
+    return records, aggregator.export()
+
+def run(names, ngames, goal=13, jobs=1, seed=None, fixorder=False, chunksize=None, profile=None, backend='python',
+        batch=0):
+    """ Play ngames games between the players in names, over jobs processes.
+    With an instrument.Aggregator as profile, the counters of all the games are added into it.
+    backend is the random generator of the games, one of dicerng.BACKENDS.
+    With batch > 0, each process plays that many games at the same time, and the players whose module has a
+    strategy_batch(states) decide the states of all the games in one call.
+
+    Returns (winner_board, records, seed). The records are sorted by game index, and are the same
+    for any number of jobs given the same master seed. """
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    if jobs is None or jobs < 1:
+        jobs = multiprocessing.cpu_count()
+    names = list(names)
+    if jobs == 1:
+        records = play_games(load_strategies(names), names, range(ngames), ngames, goal, seed, fixorder,
+                             [profile] if profile is not None else None, backend, load_batch_strategies(names), batch)
+    else:
+        if chunksize is None:
+            # a few chunks per worker to balance the load
+            chunksize = max(1, ngames // (jobs * 4))
+        tasks = [(names, range(start, min(start+chunksize, ngames)), ngames, goal, seed, fixorder, backend, batch)
+                 for start in range(0, ngames, chunksize)]
+        handles = share_modules(names)
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(names, handles, profile is not None))
+        try:
+            records = []
+            for chunk, counters in pool.imap(_play_chunk, tasks):
+                records += chunk
+                if counters is not None:
+                    profile.merge(counters)
+        finally:
+            pool.close()
+            pool.join()
+            modules = load_modules(names)
+            for p in set(modules.values()):
+                if p.__name__ in handles:
+                    p.merge(handles[p.__name__])
+    winner_board = collections.OrderedDict([(name, 0) for name in names])
+    for r in records:
+        for w in r.winners:
+            winner_board[w] += 1
+    return winner_board, records, seed
+
+def write_records(records, filename='game_results.txt'):
+    with open(filename, 'w') as game_output:
+        for r in records:
+            game_output.write('Game %-4d Round %2d : '%(r.game+1, r.rounds))
+            game_output.write(' | '.join(['%s %3d'%(name, score) for name, score in zip(r.names, r.scores)]) + '\n')
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Parallel Trainer      =
+#==========================
+
+import itertools, multiprocessing, os, tempfile, time
+import optimal, packedstate, statetable
+from turndist import FULL_BAG
+
+# Train the cachehigh of optimal.py over a process pool. The states are split by the scores at the start of
+# a round, one partition for each score tuple below goal. The scores never go down, so a partition only reaches
+# partitions with higher or equal scores: the partitions are solved in waves of the same total score, from the
+# highest total down, and the partitions of a wave do not depend on each other.
+# After each wave the new states are put into a state table file that the workers map into memory, so the
+# lower waves reuse them instead of estimating them. At the end everything is merged into the cachehigh,
+# and checkpointed into its journal after each wave.
+
+def partitions(n_players, goal, min_score=0):
+    """ The score tuples at the start of a round, grouped in waves of the same total score, highest first """
+    waves = {}
+    for scores in itertools.product(range(min_score, goal), repeat=n_players):
+        waves.setdefault(sum(scores), []).append(scores)
+    return [waves[total] for total in sorted(waves, reverse=True)]
+
+def game_table(cache, n_players, goal):
+    """ A StateTable of the states of one game in a cachehigh of optimal.py """
+    if isinstance(cache, statetable.StateTable) and (cache.n_players, cache.goal) == (n_players, goal):
+        return cache
+    table = statetable.StateTable(n_players, goal)
+    for state, result in cache.items():
+        if isinstance(state, int):
+            state = packedstate.decode(state)
+        if len(state[2]) == n_players and state[4] == goal:
+            table[state] = result
+    return table
+
+# the shared table attached in each worker process
+_worker = {}
+
+def _init_worker(max_level):
+    optimal.U_dice.max_level = max_level
+
+def _solve_partition(args):
+    """ Solve the start of a round with scores for every me, returns the new high quality states """
+    handle, scores, goal = args
+    if _worker.get('handle') != handle:
+        optimal.attach(handle)
+        _worker['handle'] = handle
+    table = optimal.U_dice.cachehigh
+    table.overflow = {}
+    table.n_new = 0
+    start = time.time()
+    values = []
+    for me in range(len(scores)):
+        # the low quality states are not shared, so the results do not depend on the order of the tasks
+        optimal.U_dice.cachelow = {}
+        state = (FULL_BAG, ((0, 0, 0), (0, 0, 0), (0, 0, 0)), scores, 0, goal, me)
+        values.append(optimal.U_dice(packedstate.encode(state)))
+    return scores, values, table.overflow, time.time() - start
+
+def train(n_players=2, goal=13, jobs=None, min_score=0, max_level=None, verbose=True):
+    """ Train the cachehigh of optimal.py for a game, returns the number of new states """
+    if jobs is None or jobs < 1:
+        jobs = multiprocessing.cpu_count()
+    max_level = optimal.U_dice.max_level if max_level is None else max_level
+    start = time.time()
+    optimal.load_cache()
+    fd, filename = tempfile.mkstemp(suffix='.zdt', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.close(fd)
+    table = game_table(optimal.U_dice.cachehigh, n_players, goal)
+    n_new = 0
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(max_level,))
+    try:
+        for wave, group in enumerate(partitions(n_players, goal, min_score)):
+            # publish the table with the states of the waves before
+            table.save(filename)
+            table = statetable.StateTable.open(filename)
+            handle = {'filename': filename, 'temporary': True, 'wave': wave}
+            n_wave = 0
+            for scores, values, new, elapsed in pool.imap_unordered(_solve_partition, [(handle, s, goal) for s in group]):
+                for (k, v) in new.items():
+                    table[k] = v
+                    optimal.U_dice.cachehigh[packedstate.encode(k)] = v
+                    if optimal.U_dice.journal is not None:
+                        optimal.U_dice.journal.record(k, v)
+                n_wave += len(new)
+                if verbose:
+                    print('scores %s: %s, %d new states in %.1f s'%(scores, ' '.join('%.4f'%v[0] for v in values), len(new), elapsed))
+            if optimal.U_dice.journal is not None:
+                optimal.U_dice.journal.flush()
+            n_new += n_wave
+            if verbose:
+                print('Wave %d, total score %d: %d partitions, %d new states, %.1f s'%(wave, sum(group[0]), len(group), n_wave, time.time() - start))
+    finally:
+        pool.close()
+        pool.join()
+        os.remove(filename)
+    optimal.save_cache()
+    if verbose:
+        print('Trained %d new states into %s in %.1f s'%(n_new, optimal.load_cache.filename or 'cachehigh', time.time() - start))
+    return n_new
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser("Train the cachehigh of optimal.py", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--players', type=int, default=2, help='Number of players.')
+    parser.add_argument('--goal', type=int, default=13, help='Goal to win the game.')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='Number of processes, 0 to use all cores.')
+    parser.add_argument('--min-score', type=int, default=0, help='Only train the rounds where every score is at least this.')
+    parser.add_argument('--max-level', type=int, help='The search depth of optimal.py, %d by default.'%optimal.U_dice.max_level)
+    args = parser.parse_args()
+    train(args.players, args.goal, args.jobs, args.min_score, args.max_level)
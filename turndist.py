@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Turn Distribution     =
+#==========================
+
+import itertools, collections
+from math import comb
+import numpy as np
+from memocache import memo
+
+# colors are indexed as (Green, Yellow, Red) and faces as (brain, runner, shotgun), same as in optimal.py
+FULL_BAG = (6, 4, 3)
+FACE_COUNTS = ((3, 2, 1),   # Green : 3 brains, 2 runners, 1 shotgun
+               (2, 2, 2),   # Yellow: 2 brains, 2 runners, 2 shotguns
+               (1, 2, 3))   # Red   : 1 brain,  2 runners, 3 shotguns
+
+# The compact turn state is (bag, runners, brains, shotguns):
+# bag      : (n_green, n_yellow, n_red) dices left in the bag
+# runners  : (n_green, n_yellow, n_red) runners on the table, to be rolled again
+# brains   : brains on the table
+# shotguns : shotguns on the table, 0 to 2 (3 or more is a bust)
+# (bag, runners) is called a key, it is all what matters for the next roll.
+
+
+@memo
+def color_faces(color, n):
+    """ All outcomes of rolling n dices of a color, as a list of ((brains, runners, shotguns), probability) """
+    weights = FACE_COUNTS[color]
+    result = collections.Counter()
+    for faces in itertools.product(range(3), repeat=n):
+        p = 1.
+        for f in faces:
+            p *= weights[f] / 6.
+        result[tuple(faces.count(f) for f in range(3))] += p
+    return list(result.items())
+
+@memo
+def roll_outcomes(bag, runners):
+    """ All outcomes of rolling the dices from a key, as a list of
+    (next_bag, new_runners, brains, shotguns, probability), where brains and shotguns are the ones rolled.
+    The bag is refilled (except for the new runners) when it can not fill a hand of 3 dices anymore. """
+    n_draw = 3 - sum(runners)
+    n_bag = sum(bag)
+    result = collections.Counter()
+    for draw in itertools.product(*[range(min(n, n_draw)+1) for n in bag]):
+        if sum(draw) != n_draw:
+            continue
+        # drawing without replacement from the bag
+        p_draw = comb(bag[0], draw[0]) * comb(bag[1], draw[1]) * comb(bag[2], draw[2]) / comb(n_bag, n_draw)
+        hand = [runners[c] + draw[c] for c in range(3)]
+        for rolled in itertools.product(*[color_faces(c, hand[c]) for c in range(3)]):
+            p = p_draw
+            for _, p_c in rolled:
+                p *= p_c
+            brains = sum(faces[0] for faces, _ in rolled)
+            new_runners = tuple(faces[1] for faces, _ in rolled)
+            shotguns = sum(faces[2] for faces, _ in rolled)
+            next_bag = tuple(bag[c] - draw[c] for c in range(3))
+            if sum(next_bag) + sum(new_runners) < 3:
+                next_bag = tuple(FULL_BAG[c] - new_runners[c] for c in range(3))
+            result[next_bag, new_runners, brains, shotguns] += p
+    return [k + (p,) for k, p in result.items()]
+
+def reachable_keys():
+    """ All the keys that can be reached in a turn from a full bag, sorted """
+    start = (FULL_BAG, (0, 0, 0))
+    keys = {start}
+    stack = [start]
+    while stack:
+        bag, runners = stack.pop()
+        for next_bag, new_runners, _, _, _ in roll_outcomes(bag, runners):
+            key = (next_bag, new_runners)
+            if key not in keys:
+                keys.add(key)
+                stack.append(key)
+    return sorted(keys)
+
+class TurnGraph(object):
+    """ The roll transitions between all reachable keys, as flat arrays.
+
+    keys      : list of (bag, runners)
+    key_index : dense array indexed by bag + runners counts, the index in keys or -1
+    src, dst  : the keys before and after a roll
+    brains, shotguns : rolled on the transition
+    p         : probability of the transition
+
+    A roll of 3 runners that shows 3 runners again does not change anything, so it is removed and the other
+    transitions of the key are renormalized; the turn ends up in the same place with the same probabilities.
+    """
+
+    def __init__(self):
+        self.keys = reachable_keys()
+        self.n_keys = len(self.keys)
+        self.key_index = -np.ones((7, 5, 4, 4, 4, 4), dtype=np.int32)
+        for i, (bag, runners) in enumerate(self.keys):
+            self.key_index[bag + runners] = i
+        src, dst, brains, shotguns, p = [], [], [], [], []
+        for i, (bag, runners) in enumerate(self.keys):
+            outcomes = [o for o in roll_outcomes(bag, runners) if not (sum(runners) == 3 and o[1] == runners and o[2] == o[3] == 0)]
+            total = sum(o[4] for o in outcomes)
+            for next_bag, new_runners, n_brains, n_shotguns, p_o in outcomes:
+                src.append(i)
+                dst.append(self.key_index[next_bag + new_runners])
+                brains.append(n_brains)
+                shotguns.append(n_shotguns)
+                p.append(p_o / total)
+        self.src = np.array(src, dtype=np.int32)
+        self.dst = np.array(dst, dtype=np.int32)
+        self.brains = np.array(brains, dtype=np.int32)
+        self.shotguns = np.array(shotguns, dtype=np.int32)
+        self.p = np.array(p)
+        # A roll either adds brains or shotguns, or turns all dices into runners. So the turn states can be solved
+        # backwards from high to low shotguns and brains, and for the same brains and shotguns, the keys with 3
+        # runners first. For each of these steps we keep the transitions from its keys that do not bust.
+        three = np.array([sum(runners) == 3 for _, runners in self.keys])
+        self.steps = {}
+        for s in range(3):
+            safe = self.shotguns < 3 - s
+            bust = np.bincount(self.src, self.p * ~safe, minlength=self.n_keys)
+            for is_three, group in ((True, three), (False, ~three)):
+                rows = np.nonzero(group)[0]
+                edges = np.nonzero(safe & group[self.src])[0]
+                self.steps[s, is_three] = (rows, bust[rows], np.searchsorted(rows, self.src[edges]), self.dst[edges],
+                                           self.brains[edges], self.shotguns[edges], self.p[edges])
+
+    def index(self, bag, runners):
+        return self.key_index[tuple(bag) + tuple(runners)]
+
+    def edges(self, i):
+        """ The slice of the transitions from the key i """
+        start, end = np.searchsorted(self.src, [i, i+1])
+        return slice(start, end)
+
+    def reachable(self, max_brains):
+        """ The turn states that can be reached from a full bag, as a (n_keys, 3, max_brains+4) boolean array,
+        when the turn always holds with more than max_brains brains """
+        R = np.zeros((self.n_keys, 3, max_brains+4), dtype=bool)
+        R[self.index(FULL_BAG, (0, 0, 0)), 0, 0] = True
+        for s in range(3):
+            for b in range(max_brains+1):
+                for three in (False, True):
+                    rows, _, src, dst, brains, shotguns, _ = self.steps[s, three]
+                    live = R[rows[src], s, b]
+                    R[dst[live], s + shotguns[live], b + brains[live]] = True
+        return R
+
+    def backward(self, hold, bust, choose, max_brains):
+        """ Solve the values of all turn states, from the last roll back to the first.
+
+        hold   : (max_brains+4, ...) values of holding with each number of brains
+        bust   : (...) value of a bust
+        choose(rows, b, s, hold, roll) : the value for the keys rows with b brains and s shotguns,
+                 given the values of holding and of rolling
+        Returns an array of (n_keys, 3, max_brains+4, ...) values for each key, shotguns and brains.
+        With more than max_brains brains a turn always holds.
+        """
+        hold = np.asarray(hold, dtype=float)
+        bust = np.asarray(bust, dtype=float)
+        W = np.empty((self.n_keys, 3) + hold.shape)
+        W[:] = hold
+        for s in (2, 1, 0):
+            for b in range(max_brains, -1, -1):
+                for three in (True, False):
+                    rows, p_bust, src, dst, brains, shotguns, p = self.steps[s, three]
+                    roll = np.multiply.outer(p_bust, bust)
+                    values = W[dst, s + shotguns, b + brains]
+                    np.add.at(roll, src, (values.T * p).T)
+                    W[rows, s, b] = choose(rows, b, s, hold[b], roll)
+        return W
+
+@memo
+def turn_graph():
+    """ The TurnGraph is the same for every game, build it once """
+    return TurnGraph()
+
+class TurnTable(object):
+    """ The exact distribution of the brains banked in a turn under a stop policy, for every turn state.
+
+    policy(bag, runners, brains, shotguns) returns True to roll and False to hold.
+    The turn always holds with max_brains or more brains, the brains above max_brains are counted as max_brains.
+    The table is computed once, then lookup() returns a distribution in O(1):
+    an array of max_brains+2 probabilities, of banking 0 to max_brains brains, and of a bust at the end.
+    """
+
+    def __init__(self, policy, max_brains=20):
+        self.graph = graph = turn_graph()
+        self.max_brains = max_brains
+        # the roll or hold decision of each turn state
+        self.roll = np.zeros((graph.n_keys, 3, max_brains+1), dtype=bool)
+        for i, (bag, runners) in enumerate(graph.keys):
+            for s in range(3):
+                for b in range(max_brains):
+                    self.roll[i, s, b] = policy(bag, runners, b, s)
+        # holding with b brains banks b of them, the last column is the bust
+        hold = np.zeros((max_brains+4, max_brains+2))
+        hold[np.arange(max_brains+4), np.minimum(np.arange(max_brains+4), max_brains)] = 1.
+        bust = np.zeros(max_brains+2)
+        bust[-1] = 1.
+        def choose(rows, b, s, hold, roll):
+            return np.where(self.roll[rows, s, b][:, None], roll, hold)
+        self.table = graph.backward(hold, bust, choose, max_brains)[:, :, :max_brains+1]
+
+    def lookup(self, bag=FULL_BAG, runners=(0, 0, 0), brains=0, shotguns=0):
+        """ The distribution of a turn state, the default is the start of a turn """
+        return self.table[self.graph.index(bag, runners), shotguns, min(brains, self.max_brains)]
+
+    def bust(self, *state):
+        """ The probability of losing the brains on the table """
+        return self.lookup(*state)[-1]
+
+    def expected(self, *state):
+        """ The expected brains banked """
+        return self.lookup(*state)[:-1].dot(np.arange(self.max_brains+1))
+
+    def save(self, filename):
+        np.save(filename, self.table)
+
+    @classmethod
+    def load(cls, filename):
+        table = cls.__new__(cls)
+        table.graph = turn_graph()
+        table.table = np.load(filename, mmap_mode='r')
+        table.max_brains = table.table.shape[2] - 1
+        return table
+
+def threshold_policy(min_brains, max_shotguns=2):
+    """ A simple policy: hold when we got min_brains brains or max_shotguns shotguns """
+    def policy(bag, runners, brains, shotguns):
+        return brains < min_brains and shotguns < max_shotguns or brains == 0
+    return policy
+
+if __name__ == '__main__':
+    import sys, time
+    min_brains = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    start = time.time()
+    table = TurnTable(threshold_policy(min_brains))
+    elapsed = time.time() - start
+    print('%d keys, %d transitions, solved in %.3f s'%(table.graph.n_keys, len(table.graph.p), elapsed))
+    dist = table.lookup()
+    print('mean brains banked %.4f, bust rate %.4f'%(table.expected(), table.bust()))
+    for k, p in enumerate(dist[:-1]):
+        if p > 0:
+            print('%2d brains : %.6f'%(k, p))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+
+#==========================
+#=  Vectorized Simulator  =
+#==========================
+
+import collections
+import numpy as np
+
+# colors are indexed as (Green, Yellow, Red) and faces as (brain, runner, shotgun), same as in optimal.py
+FULL_BAG = np.array([6, 4, 3])
+FACES = np.array([[0, 0, 0, 1, 1, 2],   # Green : 3 brains, 2 runners, 1 shotgun
+                  [0, 0, 1, 1, 2, 2],   # Yellow: 2 brains, 2 runners, 2 shotguns
+                  [0, 1, 1, 2, 2, 2]])  # Red   : 1 brain,  2 runners, 3 shotguns
+
+TurnResults = collections.namedtuple('TurnResults', 'banked, busted, rolls')
+
+class Turns(object):
+    """ A batch of n independent turns, stored as arrays of counts.
+
+    bag      : (n, 3) dices of each color left in the bag
+    runners  : (n, 3) runners of each color on the table
+    brains   : (n,) brains on the table
+    shotguns : (n,) shotguns on the table
+    score    : (n,) score of the playing player before this turn
+    max_other: (n,) highest score of the other players
+    goal     : the goal to win the game
+    active   : (n,) the turns still being played
+    """
+
+    def __init__(self, n, score=0, max_other=0, goal=13):
+        self.n = n
+        self.bag = np.tile(FULL_BAG, (n, 1))
+        self.runners = np.zeros((n, 3), dtype=int)
+        self.brains = np.zeros(n, dtype=int)
+        self.shotguns = np.zeros(n, dtype=int)
+        self.score = np.broadcast_to(np.asarray(score, dtype=int), (n,)).copy()
+        self.max_other = np.broadcast_to(np.asarray(max_other, dtype=int), (n,)).copy()
+        self.goal = goal
+        self.active = np.ones(n, dtype=bool)
+        self.busted = np.zeros(n, dtype=bool)
+        self.rolls = np.zeros(n, dtype=int)
+
+    @property
+    def n_runners(self):
+        return self.runners.sum(axis=1)
+
+    @property
+    def max_score(self):
+        """ The highest score of all players, including the playing one """
+        return np.maximum(self.score, self.max_other)
+
+    def roll(self, idx, rng):
+        """ Roll the dices for the turns with indices idx """
+        m = len(idx)
+        bag = self.bag[idx]
+        hand = self.runners[idx]
+        # draw dices from bag without replacement so we have 3 in hand
+        for k in range(3):
+            rows = np.nonzero(hand.sum(axis=1) < 3)[0]
+            if len(rows) == 0:
+                break
+            cum = bag[rows].cumsum(axis=1)
+            u = rng.random(len(rows)) * cum[:, 2]
+            color = (u >= cum[:, 0]).astype(int) + (u >= cum[:, 1])
+            bag[rows, color] -= 1
+            hand[rows, color] += 1
+        # color of each of the 3 dices, then roll them
+        slot = np.arange(3)
+        colors = (slot >= hand[:, :1]).astype(int) + (slot >= hand[:, :1] + hand[:, 1:2])
+        faces = FACES[colors, rng.integers(0, 6, (m, 3))]
+        self.brains[idx] += (faces == 0).sum(axis=1)
+        shotguns = self.shotguns[idx] + (faces == 2).sum(axis=1)
+        self.shotguns[idx] = shotguns
+        runner = faces == 1
+        new_runners = np.stack([(runner & (colors == c)).sum(axis=1) for c in range(3)], axis=1)
+        # put all dices back if the bag is empty, except the runners
+        empty = bag.sum(axis=1) < 3 - new_runners.sum(axis=1)
+        bag[empty] = FULL_BAG - new_runners[empty]
+        self.bag[idx] = bag
+        self.runners[idx] = new_runners
+        self.rolls[idx] += 1
+        # 3 or more shotguns ends the turn with nothing
+        busted = idx[shotguns > 2]
+        self.busted[busted] = True
+        self.active[busted] = False
+
+def simulate_turns(policy, n, score=0, max_other=0, goal=13, rng=None):
+    """ Play n independent turns at once with a vectorized policy.
+
+    policy(turns) takes a Turns object and returns a boolean array, True to roll and False to hold,
+    for all of its n turns (only the active ones are used).
+    Returns TurnResults of arrays: brains banked (0 if busted), busted flags and number of rolls. """
+    if rng is None:
+        rng = np.random.default_rng()
+    turns = Turns(n, score, max_other, goal)
+    while True:
+        active = np.nonzero(turns.active)[0]
+        if len(active) == 0:
+            break
+        roll = np.asarray(policy(turns), dtype=bool)[active]
+        turns.active[active[~roll]] = False
+        if roll.any():
+            turns.roll(active[roll], rng)
+    banked = np.where(turns.busted, 0, turns.brains)
+    return TurnResults(banked, turns.busted, turns.rolls)
+
+def threshold_policy(min_brains, max_shotguns=2):
+    """ A simple policy: hold when we got min_brains brains or max_shotguns shotguns """
+    def policy(turns):
+        return (turns.brains < min_brains) & (turns.shotguns < max_shotguns) | (turns.brains == 0)
+    return policy
+
+def find_policy(module):
+    """ The vectorized policy of a strategy module, defined as strategy_array(turns) """
+    try:
+        return module.strategy_array
+    except AttributeError:
+        raise RuntimeError("Function strategy_array(turns) is not found in %s"%module.__name__)
+
+if __name__ == '__main__':
+    import sys, time
+    import importlib
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    policy = find_policy(importlib.import_module(sys.argv[1])) if len(sys.argv) > 1 else threshold_policy(4)
+    start = time.time()
+    result = simulate_turns(policy, n, rng=np.random.default_rng(0))
+    elapsed = time.time() - start
+    print('%d turns in %.3f s (%.0f turns/s)'%(n, elapsed, n / elapsed))
+    print('mean brains banked %.4f, bust rate %.4f, mean rolls %.3f'%(result.banked.mean(), result.busted.mean(), result.rolls.mean()))
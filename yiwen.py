@@ -74,3 +74,13 @@ def strategy(state):
 
     # In all other cases, I roll
     return 'roll'
+
+def strategy_array(turns):
+    """ The same strategy for a batch of turns in vectorsim, returns True to roll for each turn """
+    n_brains, n_shotguns = turns.brains, turns.shotguns
+    score, max_score, goal = turns.score, turns.max_score, turns.goal
+    # if there is someone else got > 13 brains, roll until I got more brains
+    ending = max_score >= goal
+    # If I got more than 13 brains and at least 1 shotgun, or 2 brains and 2 shotguns, I hold
+    hold = (score + n_brains >= goal) & (n_shotguns > 0) | (n_brains > 1) & (n_shotguns > 1)
+    return ending & (score + n_brains < max_score) | ~ending & ~hold
@@ -3,23 +3,9 @@
 
 import itertools, time, copy
 import collections, random
-import numpy as np
-
-def memo(f):
-    """Decorator that caches the return value for each call to f(args).
-    Then when called again with same args, we can just look it up."""
-    cache = {}
-    def _f(*args):
-        try:
-            return cache[args]
-        except KeyError:
-            cache[args] = result = f(*args)
-            return result
-        except TypeError:
-            # some element of args refuses to be a dict key
-            return f(*args)
-    _f.cache = cache
-    return _f
+from memocache import memo
+import rolltable
+
 
 def strategy(state):
     """ Yudong's strategy """
@@ -69,8 +55,8 @@ def strategy(state):
         return 'roll'
     # keep rolling if I'm losing
     max_score = max([p.score for p in players])
-    if max_score >= 13 and max_score > me.score:
-        if me.score + n_brains < max_score:
+    if max_score >= 13 and max_score > playing.score:
+        if playing.score + n_brains < max_score:
             return 'roll'
         else:
             return 'hold'
@@ -92,9 +78,9 @@ def strategy(state):
             n_faces.append(len(d_f))
         dice_new.append(tuple(n_faces))
     dices = tuple(dice_new)
-    players = tuple(p[1] for p in players)
-    myidx = players.index(me)
+    myidx = players.index(playing)
     me = myidx
+    players = tuple(p[1] for p in players)
 
     state = (bag, dices, players, myidx, goal, me)
 
@@ -116,48 +102,46 @@ def best_action(state, actions, Q, U):
 #@memo
 def Q_dice(state, action, level=0, quality=0.):
     "The expected value of U of choosing action in state."
-    #print("Q_level", level)
-    if action == 'hold':
-        result, result_qual = U_dice(hold(state), level=level, quality=quality)
-    if action == 'roll':
-        # going over all possible draws from bag and all possible rolled faces
-        bag, dices, players, myidx, goal, me = state
-        runners_color = tuple(d[1] for d in dices) # (2,0,0) means 2 green runners
-        possible_colors_counter = possible_colors(bag, runners_color)
-        result = 0.
-        result_qual = 0.
-        # enumerate all possible results from rolling
-        for colors, n_c, draw_colors in possible_colors_counter:
-            q_color = 0.
-            qual_color = 0.
-            dices_counter = dices_with_color(colors)
-            counted_dices = 0
-            for rolled_dices, n_d in dices_counter:
-                #new_runners = rolled_dices.T[1]
-                new_runners = tuple(d[1] for d in rolled_dices)
-                n_new_runners = sum(new_runners)
-                #if np.sum(new_runners) != 3: # skip the 3 runners
-                if n_new_runners != 3: # skip the 3 runners
-                    dices1 = updated_dices(dices, rolled_dices)
-                    bag1 = updated_bag(bag, draw_colors, new_runners)
-                    new_state = (bag1, dices1, players, myidx, goal, me) # update the bag and dices before passing to roll
-                    state_after_roll = roll(new_state)
-                    if state_after_roll not in U_dice.pendingstates:
-                        u, qual = U_dice(state_after_roll, level=level, quality=quality)
-                        q_color += u * n_d
-                        qual_color += qual * n_d # accumulate quality over dices
-                        counted_dices += n_d
-            result += q_color / counted_dices * n_c  # there are 6x6x6 possibilities for 3 faces
-            result_qual += qual_color / counted_dices * n_c # accumulate quality over color
-            #print(colors, 'result: ', result, float(sum(cc[1] for cc in possible_colors_counter)))
-        f_possible_colors = 1. / sum(cc[1] for cc in possible_colors_counter) # factor for all possible_colors
-        result *= f_possible_colors
-        result_qual *= f_possible_colors
-    #if level == 0:
-    #    print(level, state, action, result)
-
+    if not hasattr(U_dice, 'pendingstates'):
+        U_dice.pendingstates = set()
+    result = 0.
+    result_qual = 0.
+    for p_draw, group in successors(state, action):
+        q_color = 0.
+        qual_color = 0.
+        counted_dices = 0.
+        for next_state, p_d in group:
+            # the states being searched are left out, or the search would never end
+            if next_state not in U_dice.pendingstates:
+                u, qual = U_dice(next_state, level=level, quality=quality)
+                q_color += u * p_d
+                qual_color += qual * p_d # accumulate quality over dices
+                counted_dices += p_d
+        result += q_color / counted_dices * p_draw
+        result_qual += qual_color / counted_dices * p_draw # accumulate quality over draws
     return result, result_qual
 
+def successors(state, action):
+    """ The states after an action, grouped by the dices drawn from the bag: a list of (p_draw, [(state, p), ...]).
+    A roll that shows 3 runners is not counted, the other rolls of the same draw are scaled up instead. """
+    if action == 'hold':
+        return [(1., [(hold(state), 1.)])]
+    # going over all possible draws from bag and all possible rolled faces
+    bag, dices, players, myidx, goal, me = state
+    runners_color = tuple(d[1] for d in dices) # (2,0,0) means 2 green runners
+    groups = []
+    # enumerate all possible results from rolling
+    for draw_colors, p_draw, outcomes in rolltable.draws(bag, runners_color):
+        group = []
+        for bag1, rolled_dices, p_d in outcomes:
+            new_runners = tuple(d[1] for d in rolled_dices)
+            if sum(new_runners) != 3: # skip the 3 runners
+                dices1 = updated_dices(dices, rolled_dices)
+                new_state = (bag1, dices1, players, myidx, goal, me) # update the bag and dices before passing to roll
+                group.append((roll(new_state), p_d))
+        groups.append((p_draw, group))
+    return groups
+
 @memo
 def updated_dices(dices, rolled_dices):
     result = [list(d_c) for d_c in rolled_dices]
@@ -166,90 +150,26 @@ def updated_dices(dices, rolled_dices):
             result[i][j] += dices[i][j]
     return tuple(tuple(d_c) for d_c in result)
 
-@memo
-def updated_bag(bag, draw_colors, new_runners):
-    new_bag = tuple(bag[i] - draw_colors[i] for i in range(3))
-    if sum(new_bag) + sum(new_runners) < 3: # if bag is empty
-        return (6-new_runners[0], 4-new_runners[1], 3-new_runners[2])
-    else:
-        return new_bag
-
-@memo
-def possible_colors(bag, runners_color):
-    """ Given a bag and runner dices, return a counter of all possible colors:
-    possible_colors((6, 4, 3), (0, 2, 0)) -->
-    [(('G', 'Y', 'Y'), 6, (1, 0, 0)),
-     (('Y', 'Y', 'Y'), 4, (0, 1, 0)),
-     (('Y', 'Y', 'R'), 3, (0, 0, 1))]"""
-    n_runners = sum(runners_color)
-    runner_c = tuple(['G']*runners_color[0] + ['Y']*runners_color[1] + ['R']*runners_color[2])
-    if n_runners == 3: # no need to draw
-        return [(runner_c, 1, (0,0,0))]
-    else:
-        n_draw = 3 - n_runners
-        # Expand the bag into "GGGYYYRR" and take combinations
-        bag_c = ['G']*bag[0] + ['Y']*bag[1] + ['R']*bag[2]
-        # Count the combinations appear
-        counter = collections.Counter( itertools.combinations(bag_c, n_draw) )
-        result = []
-        for c_draw, n_draw in counter.items():
-            draw_colors = (c_draw.count('G'), c_draw.count('Y'), c_draw.count('R'))
-            result.append((tuple(sorted(runner_c + c_draw, key=lambda c:'GYR'.index(c))), n_draw, draw_colors))
-        return sorted(result, key=lambda x:x[1], reverse=True)
-
-
-@memo
-def dices_with_color(colors):
-    """ Given the colors of 3 dices, e.g. ('G', 'G', 'Y')
-    generate a collection of rolled dices, return a list of (dices, numbers) tuple:
-    dices_with_color(('G', 'G', 'Y')) =
-    [(array([[1, 1, 0], [0, 1, 0], [0, 0, 0]]), 24),
-     (array([[1, 1, 0], [0, 0, 1], [0, 0, 0]]), 24),
-     (array([[1, 1, 0], [1, 0, 0], [0, 0, 0]]), 24),
-     (array([[2, 0, 0], [0, 1, 0], [0, 0, 0]]), 18),
-     (array([[2, 0, 0], [0, 0, 1], [0, 0, 0]]), 18),
-     (array([[2, 0, 0], [1, 0, 0], [0, 0, 0]]), 18),
-     (array([[1, 0, 1], [0, 0, 1], [0, 0, 0]]), 12),
-     (array([[1, 0, 1], [1, 0, 0], [0, 0, 0]]), 12),
-     (array([[1, 0, 1], [0, 1, 0], [0, 0, 0]]), 12),
-     (array([[0, 2, 0], [0, 0, 1], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [1, 0, 0], [0, 0, 0]]), 8),
-     (array([[0, 2, 0], [0, 1, 0], [0, 0, 0]]), 8),
-     (array([[0, 2, 0], [1, 0, 0], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [0, 0, 1], [0, 0, 0]]), 8),
-     (array([[0, 1, 1], [0, 1, 0], [0, 0, 0]]), 8),
-     (array([[0, 0, 2], [0, 0, 1], [0, 0, 0]]), 2),
-     (array([[0, 0, 2], [0, 1, 0], [0, 0, 0]]), 2),
-     (array([[0, 0, 2], [1, 0, 0], [0, 0, 0]]), 2)]
-    """
-    if not hasattr(dices_with_color, 'diceinfo'):
-        dices_with_color.diceinfo = {'G' : (['brain']*3 + ['runner']*2 + ['shotgun']*1),
-                                     'Y' : (['brain']*2 + ['runner']*2 + ['shotgun']*2),
-                                     'R' : (['brain']*1 + ['runner']*2 + ['shotgun']*3)}
-    throw_result = [tuple(sorted(zip(colors,faces))) for faces in itertools.product(dices_with_color.diceinfo[colors[0]], dices_with_color.diceinfo[colors[1]], dices_with_color.diceinfo[colors[2]])]
-    dices_counter = collections.Counter(throw_result).items()
-    #dices_counter.sort(key=lambda x:x[1], reverse=True)
-    # transfer dice into 3*3 matrix
-    result = []
-    for dices_c_f, n_d in dices_counter:
-        dice_transferred = np.reshape([0]*9, (3,3))
-        for dice in dices_c_f:
-            dice_transferred['GYR'.index(dice[0]), ['brain','runner','shotgun'].index(dice[1])] += 1
-        #result.append((dice_transferred, n_d))
-        result.append(( tuple(tuple(i) for i in dice_transferred) ,n_d))
-    return result
-
 #@memo
 def U_dice(state, level=0, quality=0.):
     "The utility of a state, the probability of me to win the game"
     # Assume all the opponents are playing with the optimal strategy
 
-
     # Build a quality controlled cache system for U_dice
     if not hasattr(U_dice, 'cachehigh'):
         U_dice.cachehigh = {}
     if not hasattr(U_dice, 'cachelow'):
         U_dice.cachelow = {}
+    # store the pending states to prevent infinite loop
+    if not hasattr(U_dice, 'pendingstates'):
+        U_dice.pendingstates = set()
+    result = settle(state)
+    if result is None:
+        result = search(state, level)
+    return result
+
+def settle(state):
+    """ The value of a state if it is cached or the game is decided in it, or None """
     # try to find existing answer from the high quality cache first
     try:
         return U_dice.cachehigh[state]
@@ -261,13 +181,6 @@ def U_dice(state, level=0, quality=0.):
     except:
         pass
 
-    # store the pending states to prevent infinite loop
-    if not hasattr(U_dice, 'pendingstates'):
-        U_dice.pendingstates = set()
-
-    U_dice.pendingstates.add(state)
-    #print('pending state added:  ',state)
-
     # get information
     bag, dices, players, myidx, goal, me = state
 
@@ -275,12 +188,10 @@ def U_dice(state, level=0, quality=0.):
     if myidx == len(players):
         max_score = max(players)
         # if anyone got more than goal, the game is ending
-        if max_score >= goal:
-            result = 1. if players[me] == max_score else 0.
-            quality = 1.
-            # no need to proceed to next Q_dice here because game is ending at this point
-        else: # game is not ending, we need to go to next round
-            result, quality = U_dice((bag, dices, players, 0, goal, me), level=level, quality=quality)
+        if max_score < goal:
+            return None # game is not ending, we need to go to next round
+        result = 1. if players[me] == max_score else 0.
+        # no need to proceed to next Q_dice here because game is ending at this point
     # If this is a player
     else:
         scores = list(players)
@@ -290,32 +201,89 @@ def U_dice(state, level=0, quality=0.):
         # If this is the last player of the round, I know if I got enough points
         if myidx == len(players)-1 and scores[myidx] >= goal and scores[myidx] == max_score:
             result = 1. if myidx == me else 0.
-            quality = 1.
         # If not the last player, don't keep rolling infinitely, you win if you got so many points
         elif scores[myidx] > goal + 10:
             result = 1. if myidx == me else 0.
-            quality = 1.
         # If no one is winning right now, keep searching for winning conditions
         else:
-            # go to the next recursive level of calculating winning rate
-            if myidx == me:
-                # if it's me playing, i'm maximizing the chance I win
-                result, quality = max(Q_dice(state, action, level=level+1, quality=quality) for action in zombie_actions(state))
-            else: # if it's not me playing, they will minimize the chance I win
-                result, quality = min(Q_dice(state, action, level=level+1, quality=quality) for action in zombie_actions(state))
-
-    U_dice.pendingstates.remove(state)
-    #print('pending state removed:',state)
-    # put the high quality results into the high quality cache
-    if quality == 1.0:
-        U_dice.cachehigh[state] = (result, quality)
-    else:
-        U_dice.cachelow[state] = (result, quality)
-
-    #print(state, result)
-    #time.sleep(1)
-    return (result, quality)
+            return None
+    U_dice.cachehigh[state] = (result, 1.)
+    return (result, 1.)
 
+def expand(state, level):
+    """ A frame of search(): [state, level, children, next child, sums], the children are
+    (state, action, draw, p, checked) and sums are [u, quality, counted p] of every draw of every action """
+    bag, dices, players, myidx, goal, me = state
+    U_dice.pendingstates.add(state)
+    if myidx == len(players):
+        # the next round has the value of this state
+        groups = [[(1., [((bag, dices, players, 0, goal, me), 1.)])]]
+        checked = False
+    else:
+        groups = [successors(state, action) for action in zombie_actions(state)]
+        level += 1
+        checked = True
+    children = [(next_state, a, g, p_d, checked)
+                for a, action_groups in enumerate(groups)
+                for g, (p_draw, group) in enumerate(action_groups) for next_state, p_d in group]
+    sums = [[[0., 0., 0., p_draw] for p_draw, group in action_groups] for action_groups in groups]
+    return [state, level, children, 0, sums]
+
+def search(state, level):
+    """ Search the states after a state that is not settled, me is maximizing the chance I win and the others
+    are minimizing it. The states waiting for the values of their children are kept on a stack, in the same order
+    as a recursion would visit them, they are the pending states, so a deep search does not run out of frames.
+    A roll that comes back to a pending state, when all the players lost their brains, is left out. """
+    stack = [expand(state, level)]
+    while True:
+        frame = stack[-1]
+        state, level, children, i, sums = frame
+        # accumulate the children that are known, until one has to be searched
+        while i < len(children):
+            next_state, a, g, p_d, checked = children[i]
+            if not (checked and next_state in U_dice.pendingstates):
+                value = settle(next_state)
+                if value is None:
+                    break
+                s = sums[a][g]
+                s[0] += value[0] * p_d
+                s[1] += value[1] * p_d # accumulate quality over dices
+                s[2] += p_d
+            i += 1
+        frame[3] = i
+        if i < len(children):
+            stack.append(expand(next_state, level))
+            continue
+        results = []
+        for action_sums in sums:
+            result = 0.
+            result_qual = 0.
+            for q_color, qual_color, counted_dices, p_draw in action_sums:
+                result += q_color / counted_dices * p_draw
+                result_qual += qual_color / counted_dices * p_draw # accumulate quality over draws
+            results.append((result, result_qual))
+        # if it's me playing, i'm maximizing the chance I win, if not, they will minimize it
+        if state[3] == state[5]:
+            result = max(results)
+        else:
+            result = min(results)
+        U_dice.pendingstates.remove(state)
+        # put the high quality results into the high quality cache
+        if result[1] == 1.0:
+            U_dice.cachehigh[state] = result
+        else:
+            U_dice.cachelow[state] = result
+        stack.pop()
+        if not stack:
+            return result
+        # give the value to the state waiting for it
+        parent = stack[-1]
+        next_state, a, g, p_d, checked = parent[2][parent[3]]
+        s = parent[4][a][g]
+        s[0] += result[0] * p_d
+        s[1] += result[1] * p_d
+        s[2] += p_d
+        parent[3] += 1
 
 
 def zombie_actions(state):